@@ -1 +1,2 @@
-__all__ = ['const', 'wikidot_api']
+__all__ = ['async_wikidot_api', 'blob_store', 'budget', 'const', 'file_inventory', 'file_manifest', 'metrics',
+           'page_index', 'pipeline', 'priority', 'rate_limit', 'retry', 'scheduler', 'sync_state', 'wikidot_api']
@@ -0,0 +1,253 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import base64
+import gzip
+import json
+import logging
+import socket
+import ssl
+import time
+from urllib.parse import urlsplit, unquote
+from xmlrpc.client import dumps, loads, ProtocolError
+
+from api.const import PATH_CREDENTIAL, FROM_SITE, TO_SITE, API_MAX_WORKERS, API_META_BATCH, API_READ_TIMEOUT
+from api.rate_limit import shared_limiter
+from api.retry import RetryPolicy, classify_error, RATE_LIMITED
+from api.metrics import METRICS
+from api.wikidot_api import WikidotAPI
+
+LOG = logging.getLogger(__name__)
+
+
+class _ConnectionPool(object):
+    """
+    Keep-alive HTTP/1.1 connections to one host, reused across requests.
+    At most max_size connections are open; idle ones are kept for the next request.
+    """
+
+    def __init__(self, host, port, use_ssl, max_size):
+        self.host = host
+        self.port = port
+        self.ssl = ssl.create_default_context() if use_ssl else None
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_size)
+        self.opened = 0
+
+    async def acquire(self):
+        await self.slots.acquire()
+        while self.idle:
+            reader, writer = self.idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer
+            writer.close()
+        try:
+            self.opened += 1
+            return await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def release(self, conn, keep_alive):
+        reader, writer = conn
+        if keep_alive and not writer.is_closing():
+            self.idle.append(conn)
+        else:
+            writer.close()
+        self.slots.release()
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class AsyncWikidotAPI(object):
+    """
+    asyncio counterpart of WikidotAPI with the same read/write method surface.
+
+    Requests share the per-user token bucket with WikidotAPI, run at most
+    `concurrency` at a time over pooled keep-alive connections, and accept
+    gzip responses. HTTP errors raise xmlrpc.client.ProtocolError, as with ServerProxy,
+    and a response that stalls for read_timeout seconds raises TimeoutError.
+
+        async with AsyncWikidotAPI() as api:
+            pages = await api.get_pages(site)
+            page_data = await asyncio.gather(*[api.get_single_page(site, p) for p in pages])
+    """
+
+    API_PATH_TEMPLATE = WikidotAPI.API_PATH_TEMPLATE
+
+    def __init__(self,
+                 credential_file=PATH_CREDENTIAL,
+                 permission='ro',
+                 from_site=FROM_SITE,
+                 to_site=TO_SITE,
+                 concurrency=API_MAX_WORKERS,
+                 limiter=None,
+                 api_path=None,
+                 retry_policy=None,
+                 read_timeout=API_READ_TIMEOUT
+                 ):
+        credential = json.load(open(credential_file))
+        self.user = credential['user']
+        self.permission = permission
+        key = credential['rw_key'] if permission == 'rw' else credential['ro_key']
+        self.from_site = from_site
+        self.to_site = to_site
+        self.concurrency = concurrency
+        self.limiter = limiter or shared_limiter(self.user)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.read_timeout = read_timeout
+
+        url = urlsplit(api_path or self.API_PATH_TEMPLATE.format(user=self.user, key=key))
+        self.path = url.path or '/'
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == 'https' else 80)
+        auth = '{}:{}'.format(unquote(url.username or ''), unquote(url.password or ''))
+        self.auth_header = 'Basic ' + base64.b64encode(auth.encode('utf-8')).decode('ascii')
+        self.pool = _ConnectionPool(self.host, self.port, url.scheme == 'https', concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.pool.close()
+
+    async def _read(self, coro):
+        # a stalled keep-alive connection must not hang its caller; socket.timeout is TRANSIENT for classify_error
+        try:
+            return await asyncio.wait_for(coro, self.read_timeout)
+        except asyncio.TimeoutError:
+            raise socket.timeout('no response from {} in {} sec'.format(self.host, self.read_timeout))
+
+    async def _post(self, body):
+        request = (
+            'POST {} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Authorization: {}\r\n'
+            'Content-Type: text/xml\r\n'
+            'Accept-Encoding: gzip\r\n'
+            'Connection: keep-alive\r\n'
+            'Content-Length: {}\r\n\r\n'
+        ).format(self.path, self.host, self.auth_header, len(body)).encode('latin-1') + body
+
+        conn = await self.pool.acquire()
+        keep_alive = False
+        try:
+            reader, writer = conn
+            writer.write(request)
+            await writer.drain()
+
+            status_line = await self._read(reader.readline())
+            if not status_line:
+                raise ConnectionError('connection closed by {}'.format(self.host))
+            version, status, reason = (status_line.decode('latin-1').rstrip('\r\n').split(None, 2) + [''])[:3]
+            headers = {}
+            while True:
+                line = await self._read(reader.readline())
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                k, v = line.decode('latin-1').split(':', 1)
+                headers[k.strip().lower()] = v.strip()
+
+            if headers.get('transfer-encoding', '').lower() == 'chunked':
+                chunks = []
+                while True:
+                    size = int((await self._read(reader.readline())).split(b';')[0], 16)
+                    if not size:
+                        await self._read(reader.readline())
+                        break
+                    chunks.append(await self._read(reader.readexactly(size)))
+                    await self._read(reader.readline())
+                data = b''.join(chunks)
+            elif 'content-length' in headers:
+                data = await self._read(reader.readexactly(int(headers['content-length'])))
+            else:
+                data = await self._read(reader.read())
+
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' and (version == 'HTTP/1.1' or connection == 'keep-alive')
+        finally:
+            self.pool.release(conn, keep_alive)
+
+        if status != '200':
+            # same as ServerProxy, so classify_error tells 429 / 5xx / 4xx apart
+            raise ProtocolError(self.host + self.path, int(status), reason, headers)
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            data = gzip.decompress(data)
+        return data
+
+    async def call(self, method, *params):
+        # every call goes through the shared rate limiter, with the same retry policy as WikidotAPI.call
+        body = dumps(params, methodname=method, allow_none=True).encode('utf-8')
+        site = params[0].get('site') if params and isinstance(params[0], dict) else None
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = 0.
+            while True:
+                wait = self.limiter.try_acquire()
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+                waited += wait
+            METRICS.record_limiter_wait(waited)
+            ts = time.time()
+            try:
+                METRICS.record_bytes(sent=len(body))
+                data = await self._post(body)
+                METRICS.record_bytes(received=len(data))
+                # raises xmlrpc.client.Fault for api errors, same as ServerProxy
+                r = loads(data, use_builtin_types=False)[0][0]
+            except Exception as e:
+                METRICS.record_call(method, site, time.time() - ts, error=True)
+                kind = classify_error(e)
+                if kind == RATE_LIMITED:
+                    self.limiter.penalize()
+                if not self.retry_policy.should_retry(kind, attempt):
+                    raise
+                METRICS.record_retry(method, kind)
+                delay = self.retry_policy.delay(attempt)
+                LOG.warning("{} failed ({}: {}), retry {}/{} in {:.2f} sec".format(
+                    method, kind, e, attempt, self.retry_policy.max_attempts - 1, delay))
+                await asyncio.sleep(delay)
+                continue
+            METRICS.record_call(method, site, time.time() - ts)
+            self.limiter.reward()
+            return r
+
+    async def get_categories(self, site):
+        return await self.call('categories.select', {'site': site})
+
+    async def get_pages(self, site, categories=None, page=None):
+        data = {'site': site}
+        if page is not None:
+            data['page'] = page
+        if categories:
+            data['categories'] = categories
+        return await self.call('pages.select', data)
+
+    async def get_pages_meta(self, site, pages):
+        # dictionary: page name -> metadata; batches run concurrently
+        chunks = [pages[i:i + API_META_BATCH] for i in range(0, len(pages), API_META_BATCH)]
+        meta = {}
+        for m in await asyncio.gather(*[self.call('pages.get_meta', {'site': site, 'pages': c}) for c in chunks]):
+            meta.update(m)
+        return meta
+
+    async def get_files(self, site, page):
+        return await self.call('files.select', {'site': site, 'page': page})
+
+    async def get_file_content(self, site, page, filename):
+        return await self.call('files.get_one', {'site': site, 'page': page, 'file': filename})
+
+    async def get_single_page(self, site, page):
+        return await self.call('pages.get_one', {'site': site, 'page': page})
+
+    async def save_one_page(self, page_to_save):
+        return await self.call('pages.save_one', page_to_save)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import base64
+import hashlib
+import io
+import logging
+import os
+import shutil
+import tempfile
+
+from utility.util import iter_b64decode
+
+LOG = logging.getLogger(__name__)
+
+
+class BlobStore(object):
+    """
+    Local content-addressed store of file contents: <root>/<sha1[:2]>/<sha1>.
+
+    The same image attached to many pages is stored once. Contents arrive as
+    base64 text from files.get_one and are decoded to disk in chunks while
+    hashing; a finished blob is moved into place atomically, so a blob that
+    exists is always complete.
+    """
+
+    ENCODE_CHUNK = 3 * (1 << 16)  # bytes per base64 encode step (multiple of 3)
+
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, sha1):
+        return os.path.join(self.root, sha1[:2], sha1)
+
+    def has(self, sha1):
+        return sha1 is not None and os.path.exists(self.path(sha1))
+
+    def put_b64(self, content):
+        # returns (sha1, size) of the decoded content
+        h = hashlib.sha1()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for data in iter_b64decode(content):
+                    h.update(data)
+                    fh.write(data)
+                    size += len(data)
+            sha1 = h.hexdigest()
+            if self.has(sha1):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(self.path(sha1)), exist_ok=True)
+                os.replace(tmp_path, self.path(sha1))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return sha1, size
+
+    def read_b64(self, sha1):
+        # base64 text for files.save_one
+        parts = []
+        with io.open(self.path(sha1), 'rb') as fh:
+            for data in iter(lambda: fh.read(self.ENCODE_CHUNK), b''):
+                parts.append(base64.b64encode(data).decode('ascii'))
+        return ''.join(parts)
+
+    def export(self, sha1, dest):
+        # place a readable copy of the blob at dest (hard link when possible)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            os.remove(dest)
+        try:
+            os.link(self.path(sha1), dest)
+        except OSError:
+            shutil.copyfile(self.path(sha1), dest)
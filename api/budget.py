@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from api.const import BUDGET_RESERVE_SEC, BUDGET_RESERVE_REQUESTS
+from api.metrics import METRICS
+
+LOG = logging.getLogger(__name__)
+
+
+class RunBudget(object):
+    """
+    Wall-time and API-request budget of a run.
+
+    Work items are handed out through take(). Before each new item, the budget
+    projects what the in-flight items plus the new one will cost, using the
+    average cost of the items finished so far. It stops handing out items once
+    that projection, plus a reserve for draining and writing the checkpoint and
+    report, would go over the budget. Items already started always finish.
+    """
+
+    def __init__(self, max_runtime=None, max_requests=None,
+                 reserve_sec=BUDGET_RESERVE_SEC, reserve_requests=BUDGET_RESERVE_REQUESTS):
+        self.max_runtime = max_runtime
+        self.max_requests = max_requests
+        self.reserve_sec = reserve_sec
+        self.reserve_requests = reserve_requests
+        self.start_time = time.time()
+        self.start_requests = METRICS.total_calls()
+        self.lock = threading.Lock()
+        self.started = 0
+        self.completed = 0
+        self.stopped = None
+        # cost per item is measured from the first item on, not counting the setup before it
+        self.work_start_time = None
+        self.work_start_requests = None
+
+    def __bool__(self):
+        return bool(self.max_runtime or self.max_requests)
+
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def requests(self):
+        return METRICS.total_calls() - self.start_requests
+
+    def _check(self):
+        # reason to stop, None if the next item fits. the reserve is at most a tenth of the budget
+        in_flight = self.started - self.completed
+        if self.work_start_time is None:
+            self.work_start_time = time.time()
+            self.work_start_requests = METRICS.total_calls()
+        if self.max_runtime:
+            per_item = (time.time() - self.work_start_time) / self.completed if self.completed else 0
+            reserve = min(self.reserve_sec, self.max_runtime * .1)
+            if self.elapsed() + (in_flight + 1) * per_item > self.max_runtime - reserve:
+                return 'max runtime {} sec'.format(self.max_runtime)
+        if self.max_requests:
+            per_item = (METRICS.total_calls() - self.work_start_requests) / float(self.completed) \
+                if self.completed else 0
+            reserve = min(self.reserve_requests, self.max_requests * .1)
+            if self.requests() + (in_flight + 1) * per_item > self.max_requests - reserve:
+                return 'max requests {}'.format(self.max_requests)
+        return None
+
+    def take(self, items):
+        # yields items while the budget allows; call done() as each one finishes
+        for item in items:
+            with self.lock:
+                if self.stopped is None:
+                    self.stopped = self._check()
+                if self.stopped:
+                    LOG.warning("Budget: stopping after {} items ({}). Draining {} in flight.".format(
+                        self.started, self.stopped, self.started - self.completed))
+                    return
+                self.started += 1
+            yield item
+
+    def done(self):
+        with self.lock:
+            self.completed += 1
+
+    def summary(self):
+        return {
+            'stopped': self.stopped,
+            'items_started': self.started,
+            'elapsed_sec': round(self.elapsed(), 1),
+            'requests': self.requests(),
+            'max_runtime': self.max_runtime,
+            'max_requests': self.max_requests,
+        }
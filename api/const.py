@@ -12,8 +12,49 @@ CONST_FILE_PREFIX = 'http://www.horizon-wiki.cn/local--files'
 CONST_IMG_URL_PATTERN = 'https?://[^/]+\.(?:jpg|gif|png|jpeg)'
 
 
+# api rate limit: 240 req per min per user
+API_RATE_PER_MIN = 240
+API_BURST = 8
+# floor when backing off after rate-limit faults
+API_MIN_RATE_PER_MIN = 30
+# concurrent in-flight requests
+API_MAX_WORKERS = 8
+# max pages per pages.get_meta call
+API_META_BATCH = 10
+# retries of rate-limited / transient failures: jittered exponential backoff (sec)
+API_RETRY_ATTEMPTS = 5
+API_RETRY_BASE_DELAY = 0.5
+API_RETRY_MAX_DELAY = 30
+# seconds to wait for (each part of) a response before giving up on the connection
+API_READ_TIMEOUT = 60
+
+
 PATH_CREDENTIAL = 'api/credential.json'
 PATH_CONVERT_EXCEPTION = 'convert_exception.json'
+PATH_SYNC_STATE = 'sync_state.sqlite'
+PATH_CONVERT_CACHE = 'convert_cache.sqlite'
+PATH_FILE_MANIFEST = 'file_manifest.json'
+PATH_FILE_INVENTORY = 'file_inventory.sqlite'
+
+# --max_runtime / --max_requests: kept back for draining in-flight work and writing checkpoint and report
+BUDGET_RESERVE_SEC = 30
+BUDGET_RESERVE_REQUESTS = 50
+
+# checkpoint journal: default path per action, flush interval
+PATH_JOURNAL_TEMPLATE = '{action}.journal.jsonl'
+JOURNAL_FLUSH_EVERY = 20
+JOURNAL_FLUSH_SEC = 10
+
+# archive: pages per compressed block
+ARCHIVE_BLOCK_PAGES = 100
+# offline conversion: pages per worker task
+ARCHIVE_CONVERT_BATCH = 20
+
+# conversion cache: entries kept in memory, and on disk (oldest written are pruned first; 0: unbounded)
+CONVERT_CACHE_SIZE = 50000
+CONVERT_CACHE_DISK_ROWS = 500000
+# pages with at least this many lines convert line by line, reusing cached lines (0: always whole page)
+CONVERT_SEGMENT_MIN_LINES = 40
 
 
 # pages need special handling
@@ -62,6 +103,15 @@ KEEP_TITLE = [
  'vo'
 ]
 
+# convert_site page priority (see api/priority.py): category -> weight, 1 if not listed
+CATEGORY_WEIGHTS = {
+    # 'song': 2,
+    # 'news': 0.5,
+}
+PRIORITY_MISSING = 100           # page missing in target
+PRIORITY_RECENT = 50             # page edited just now, halving every PRIORITY_RECENT_HALF_LIFE days
+PRIORITY_RECENT_HALF_LIFE = 7
+
 # file to keep (skip overwrite and copy)
 # naming convention: page_name/file_name
 KEEP_FILE = [
@@ -80,3 +130,9 @@ CONTENT_BROKEN_PAGES = [
 
 # logging
 LOGGING_FORMAT = '[%(levelname)s %(asctime)s |%(module)s] %(message)s'
+
+# service (app.py)
+SERVICE_JOB_WORKERS = 1         # category/site jobs running at once
+SERVICE_MAX_PENDING_JOBS = 4    # queued + running jobs before new ones are rejected
+SERVICE_MAX_CONCURRENT = 8      # text/page conversions served at once
+SERVICE_ACQUIRE_TIMEOUT = 10    # seconds a request waits for a free slot
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from api.const import PATH_FILE_INVENTORY
+
+LOG = logging.getLogger(__name__)
+
+
+class FileInventory(object):
+    """
+    Local record of the file names attached to each page of a site, kept in SQLite.
+
+    Each entry stores the page revision and update time it was listed at. Uploading
+    or deleting a file adds a page revision, so a page is listed again only when its
+    metadata moved; everything else is served from the inventory.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS page_files (
+        site TEXT NOT NULL,
+        page TEXT NOT NULL,
+        revision INTEGER,
+        updated_at TEXT,
+        files TEXT NOT NULL,
+        listed_at REAL,
+        PRIMARY KEY (site, page)
+    )
+    """
+
+    def __init__(self, path=PATH_FILE_INVENTORY):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(self.SCHEMA)
+        self.conn.commit()
+
+    def _load(self, site):
+        rows = self.conn.execute('SELECT page, revision, updated_at, files FROM page_files WHERE site=?', (site,))
+        return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+    def stale_pages(self, site, metas):
+        """
+        Args:
+            site: site name
+            metas: dictionary page name -> page metadata (pages.get_meta); None if unknown
+
+        Returns: pages to list again, in the order of metas
+        """
+        with self.lock:
+            stored = self._load(site)
+        stale = []
+        for page, meta in metas.items():
+            entry = stored.get(page)
+            if entry is None or meta is None \
+                    or (meta.get('revisions'), meta.get('updated_at')) != (entry[0], entry[1]):
+                stale.append(page)
+        return stale
+
+    def update(self, site, page, meta, files):
+        meta = meta or {}
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO page_files VALUES (?, ?, ?, ?, ?, ?)',
+                              (site, page, meta.get('revisions'), meta.get('updated_at'),
+                               json.dumps(sorted(files), ensure_ascii=False), time.time()))
+
+    def files(self, site, pages):
+        # dictionary page -> list of file names, for the given pages
+        with self.lock:
+            stored = self._load(site)
+        return {p: json.loads(stored[p][2]) for p in pages if p in stored}
+
+    def prune(self, site, pages):
+        # drop pages no longer in the site
+        pages = set(pages)
+        with self.lock:
+            gone = [p for p in self._load(site) if p not in pages]
+            self.conn.executemany('DELETE FROM page_files WHERE site=? AND page=?', [(site, p) for p in gone])
+        if gone:
+            LOG.info("File inventory: dropped {} pages no longer in {}.".format(len(gone), site))
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+from api.const import PATH_FILE_MANIFEST
+from utility.util import iter_b64decode
+
+LOG = logging.getLogger(__name__)
+
+
+def file_content_hash(content):
+    # content: base64 text as returned by files.get_one
+    h = hashlib.sha1()
+    for data in iter_b64decode(content):
+        h.update(data)
+    return h.hexdigest()
+
+
+class FileManifest(object):
+    """
+    Local record of content hashes of files we have seen, keyed by site/page/file.
+
+    An entry is trusted only while the file metadata from the API (size and
+    upload time) still matches what was recorded with the hash; uploaded_at
+    None means the upload time was not known yet and is filled in on next use.
+    """
+
+    def __init__(self, path=PATH_FILE_MANIFEST):
+        self.path = path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        if path and os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as fh:
+                self.entries = json.load(fh)
+            LOG.info("Loaded file manifest {}: {} entries.".format(path, len(self.entries)))
+
+    @staticmethod
+    def key(site, page, filename):
+        return u'{}/{}/{}'.format(site, page, filename)
+
+    def lookup(self, site, page, filename, meta):
+        # hash of the file if the recorded entry still matches its metadata; None otherwise
+        k = self.key(site, page, filename)
+        with self.lock:
+            entry = self.entries.get(k)
+            if not entry or entry['size'] != meta.get('size'):
+                return None
+            if entry['uploaded_at'] is None:
+                entry['uploaded_at'] = meta.get('uploaded_at')
+                self.dirty = True
+            elif entry['uploaded_at'] != meta.get('uploaded_at'):
+                return None
+            return entry['sha1']
+
+    def record(self, site, page, filename, sha1, size, uploaded_at=None):
+        with self.lock:
+            self.entries[self.key(site, page, filename)] = {
+                'sha1': sha1, 'size': size, 'uploaded_at': uploaded_at}
+            self.dirty = True
+
+    def save(self):
+        with self.lock:
+            if not self.path or not self.dirty:
+                return
+            tmp_path = self.path + '.tmp'
+            with io.open(tmp_path, 'w', encoding='utf-8') as fh:
+                json.dump(self.entries, fh, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import threading
+import time
+from xmlrpc.client import Transport, SafeTransport
+
+LOG = logging.getLogger(__name__)
+
+
+class ApiMetrics(object):
+    """
+    Process-wide counters for api calls: calls, errors and latency histogram per
+    (method, site), bytes sent/received, retries by failure class and time spent
+    waiting on the rate limiter. Exported as a JSON-able summary or Prometheus text.
+    """
+
+    # latency histogram upper bounds (sec)
+    BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., float('inf'))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.start_time = time.time()
+            self.calls = {}
+            self.bytes_out = 0
+            self.bytes_in = 0
+            self.retries = {}
+            self.limiter_wait_sec = 0.
+            self.stages = {}
+
+    def _call_entry(self, method, site):
+        key = (method, site or '-')
+        entry = self.calls.get(key)
+        if entry is None:
+            entry = self.calls[key] = {'count': 0, 'errors': 0, 'total_sec': 0., 'max_sec': 0.,
+                                       'buckets': [0] * len(self.BUCKETS)}
+        return entry
+
+    def record_call(self, method, site, seconds, error=False):
+        with self.lock:
+            entry = self._call_entry(method, site)
+            entry['count'] += 1
+            entry['total_sec'] += seconds
+            entry['max_sec'] = max(entry['max_sec'], seconds)
+            if error:
+                entry['errors'] += 1
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    entry['buckets'][i] += 1
+                    break
+            self._add_stage('io_wait', seconds)
+
+    def record_bytes(self, sent=0, received=0):
+        with self.lock:
+            self.bytes_out += sent
+            self.bytes_in += received
+
+    def record_retry(self, method, kind):
+        with self.lock:
+            key = '{}:{}'.format(method, kind)
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def record_limiter_wait(self, seconds):
+        if seconds:
+            with self.lock:
+                self.limiter_wait_sec += seconds
+                self._add_stage('rate_limit_wait', seconds)
+
+    def _add_stage(self, stage, seconds):
+        entry = self.stages.setdefault(stage, {'count': 0, 'total_sec': 0.})
+        entry['count'] += 1
+        entry['total_sec'] += seconds
+
+    def record_stage(self, stage, seconds):
+        # cpu / io stage timings (see utility.profiling.stage_timer).
+        # io_wait (api calls) and rate_limit_wait are recorded with the calls.
+        with self.lock:
+            self._add_stage(stage, seconds)
+
+    def total_calls(self):
+        with self.lock:
+            return sum(e['count'] for e in self.calls.values())
+
+    @staticmethod
+    def _quantile(buckets, bounds, q):
+        # upper bound of the bucket holding the q-quantile
+        total = sum(buckets)
+        if not total:
+            return 0.
+        seen = 0
+        for n, bound in zip(buckets, bounds):
+            seen += n
+            if seen >= q * total:
+                return bound
+        return bounds[-1]
+
+    def summary(self):
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            calls = {}
+            for (method, site), e in sorted(self.calls.items()):
+                calls['{} {}'.format(method, site)] = {
+                    'count': e['count'],
+                    'errors': e['errors'],
+                    'avg_sec': round(e['total_sec'] / e['count'], 4) if e['count'] else 0,
+                    'p50_sec': self._quantile(e['buckets'], self.BUCKETS, .5),
+                    'p95_sec': self._quantile(e['buckets'], self.BUCKETS, .95),
+                    'max_sec': round(e['max_sec'], 4),
+                    'total_sec': round(e['total_sec'], 2),
+                }
+            total = sum(e['count'] for e in self.calls.values())
+            return {
+                'elapsed_sec': round(elapsed, 2),
+                'calls_total': total,
+                'calls_per_sec': round(total / elapsed, 2) if elapsed else 0,
+                'bytes_out': self.bytes_out,
+                'bytes_in': self.bytes_in,
+                'retries': dict(self.retries),
+                'limiter_wait_sec': round(self.limiter_wait_sec, 2),
+                'calls': calls,
+                'stages': {k: {'count': v['count'], 'total_sec': round(v['total_sec'], 2)}
+                           for k, v in self.stages.items()},
+            }
+
+    def report_text(self):
+        # short text for the Slack report
+        s = self.summary()
+        lines = ['API: {} calls ({}/sec), {:.2f} MB in, {:.2f} MB out, {:.1f} sec waiting on rate limit, '
+                 'retries: {}'.format(s['calls_total'], s['calls_per_sec'], s['bytes_in'] / 1e6,
+                                      s['bytes_out'] / 1e6, s['limiter_wait_sec'], s['retries'] or 0)]
+        for name, c in sorted(s['calls'].items(), key=lambda kv: -kv[1]['total_sec']):
+            lines.append('  {}: {} calls, {} errors, avg {}s, p95 <= {}s'.format(
+                name, c['count'], c['errors'], c['avg_sec'], c['p95_sec']))
+        for name, st in sorted(s['stages'].items(), key=lambda kv: -kv[1]['total_sec']):
+            lines.append('  stage {}: {} sec in {} calls'.format(name, st['total_sec'], st['count']))
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as fh:
+            json.dump(self.summary(), fh, indent=2)
+
+    def prometheus_text(self):
+        with self.lock:
+            out = ['# TYPE wikidot_api_calls_total counter',
+                   '# TYPE wikidot_api_errors_total counter',
+                   '# TYPE wikidot_api_latency_seconds histogram']
+            for (method, site), e in sorted(self.calls.items()):
+                labels = 'method="{}",site="{}"'.format(method, site)
+                out.append('wikidot_api_calls_total{{{}}} {}'.format(labels, e['count']))
+                out.append('wikidot_api_errors_total{{{}}} {}'.format(labels, e['errors']))
+                cumulative = 0
+                for bound, n in zip(self.BUCKETS, e['buckets']):
+                    cumulative += n
+                    le = '+Inf' if bound == float('inf') else bound
+                    out.append('wikidot_api_latency_seconds_bucket{{{},le="{}"}} {}'.format(labels, le, cumulative))
+                out.append('wikidot_api_latency_seconds_sum{{{}}} {}'.format(labels, e['total_sec']))
+                out.append('wikidot_api_latency_seconds_count{{{}}} {}'.format(labels, e['count']))
+            out.append('# TYPE wikidot_api_bytes_total counter')
+            out.append('wikidot_api_bytes_total{{direction="out"}} {}'.format(self.bytes_out))
+            out.append('wikidot_api_bytes_total{{direction="in"}} {}'.format(self.bytes_in))
+            out.append('# TYPE wikidot_api_retries_total counter')
+            for key, n in sorted(self.retries.items()):
+                method, kind = key.rsplit(':', 1)
+                out.append('wikidot_api_retries_total{{method="{}",kind="{}"}} {}'.format(method, kind, n))
+            out.append('# TYPE wikidot_api_rate_limit_wait_seconds_total counter')
+            out.append('wikidot_api_rate_limit_wait_seconds_total {}'.format(self.limiter_wait_sec))
+            out.append('# TYPE wikidot_stage_seconds_total counter')
+            for stage, st in sorted(self.stages.items()):
+                out.append('wikidot_stage_seconds_total{{stage="{}"}} {}'.format(stage, st['total_sec']))
+            return '\n'.join(out) + '\n'
+
+
+METRICS = ApiMetrics()
+
+
+class _CountingResponse(object):
+    # wraps an http response to count body bytes read by xmlrpc's parser
+    def __init__(self, response, metrics):
+        self._response = response
+        self._metrics = metrics
+
+    def read(self, *args):
+        data = self._response.read(*args)
+        self._metrics.record_bytes(received=len(data))
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+
+class _CountingMixin(object):
+    metrics = METRICS
+
+    def send_content(self, connection, request_body):
+        self.metrics.record_bytes(sent=len(request_body))
+        return super(_CountingMixin, self).send_content(connection, request_body)
+
+    def parse_response(self, response):
+        return super(_CountingMixin, self).parse_response(_CountingResponse(response, self.metrics))
+
+
+class CountingTransport(_CountingMixin, Transport):
+    pass
+
+
+class CountingSafeTransport(_CountingMixin, SafeTransport):
+    pass
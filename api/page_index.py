@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import sys
+import threading
+
+LOG = logging.getLogger(__name__)
+
+
+class PageNames(object):
+    """
+    Table of interned page names <-> integer ids.
+
+    A name listed by both sites is stored once and gets the same id in every
+    PageIndex sharing the table, so comparing sites is a set operation over ints.
+    PAGE_NAMES is the process-wide default; a long-lived process (the http service)
+    gives each run its own table, so names are freed with the run.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.lock = threading.Lock()
+
+    def add(self, name):
+        i = self.ids.get(name)
+        if i is None:
+            with self.lock:
+                i = self.ids.get(name)
+                if i is None:
+                    name = sys.intern(name)
+                    i = len(self.names)
+                    self.names.append(name)
+                    self.ids[name] = i
+        return i
+
+    def id(self, name):
+        return self.ids.get(name)
+
+    def name(self, i):
+        return self.names[i]
+
+
+PAGE_NAMES = PageNames()
+
+
+class PageRecord(object):
+    """
+    One page of one site. Reads like the pages.get_meta dictionary through get(),
+    so it can stand in for page metadata (SyncState, FileInventory, prioritize_pages).
+    """
+
+    __slots__ = ('id', 'names', 'category', 'revision', 'updated_at', 'parent', 'content_hash', 'file_count')
+
+    # pages.get_meta key -> attribute
+    META_KEYS = {'revisions': 'revision', 'updated_at': 'updated_at', 'parent_fullname': 'parent'}
+
+    def __init__(self, page_id, category, names=PAGE_NAMES):
+        self.id = page_id
+        self.names = names
+        self.category = category
+        self.revision = None
+        self.updated_at = None
+        self.parent = None
+        self.content_hash = None
+        self.file_count = None
+
+    @property
+    def name(self):
+        return self.names.name(self.id)
+
+    def update_meta(self, meta):
+        self.revision = meta.get('revisions')
+        self.updated_at = meta.get('updated_at')
+        parent = meta.get('parent_fullname')
+        self.parent = self.names.name(self.names.add(parent)) if parent else None
+
+    def get(self, key, default=None):
+        if key == 'fullname':
+            return self.name
+        attr = self.META_KEYS.get(key)
+        value = getattr(self, attr) if attr else None
+        return default if value is None else value
+
+    def __repr__(self):
+        return '<PageRecord {} rev={} updated_at={}>'.format(self.name, self.revision, self.updated_at)
+
+
+class PageIndex(object):
+    """
+    Pages of one site, in listing order: page name -> PageRecord.
+
+    Names are interned in page_names (PAGE_NAMES by default); set operations between
+    sites sharing the table go through ids().
+    """
+
+    def __init__(self, site, page_names=None):
+        self.site = site
+        self.page_names = page_names or PAGE_NAMES
+        self.records = {}
+
+    @classmethod
+    def from_pages(cls, site, pages, metas=None, page_names=None):
+        """
+        Args:
+            site: site name
+            pages: page names
+            metas: (page name, metadata) pairs, e.g. WikidotAPI.get_pages_meta
+            page_names: PageNames table, PAGE_NAMES if None
+        """
+        index = cls(site, page_names=page_names)
+        for p in pages:
+            index.add(p)
+        if metas is not None:
+            index.update_meta(metas)
+        return index
+
+    def add(self, name):
+        i = self.page_names.add(name)
+        record = self.records.get(i)
+        if record is None:
+            category = sys.intern(name.split(':')[0]) if ':' in name else '_default'
+            record = self.records[i] = PageRecord(i, category, names=self.page_names)
+        return record
+
+    def update_meta(self, metas):
+        for name, meta in metas:
+            i = self.page_names.id(name)
+            if i in self.records:
+                self.records[i].update_meta(meta)
+
+    def get(self, name, default=None):
+        i = self.page_names.id(name)
+        return self.records.get(i, default) if i is not None else default
+
+    def __contains__(self, name):
+        i = self.page_names.id(name)
+        return i is not None and i in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        # page names in listing order
+        for i in self.records:
+            yield self.page_names.name(i)
+
+    def ids(self):
+        return self.records.keys()
+
+    def names_of(self, ids):
+        # page names of the given ids, in id (first listing) order
+        return [self.page_names.name(i) for i in sorted(ids)]
+
+    def memory_bytes(self):
+        # approximate bytes held for this site's pages (records, their values and the id map);
+        # names are counted once in PAGE_NAMES, shared by all sites
+        size = sys.getsizeof(self.records)
+        for i, record in self.records.items():
+            size += sys.getsizeof(record) + sys.getsizeof(i)
+            for attr in ('updated_at', 'content_hash'):
+                value = getattr(record, attr)
+                if value is not None:
+                    size += sys.getsizeof(value)
+        return size
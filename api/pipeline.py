@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import queue
+import threading
+import time
+
+LOG = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage(object):
+    """
+    One pipeline stage: `workers` threads applying func to items from the
+    upstream queue. func returns the item for the next stage, or None to drop it.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        # bounded input queue: upstream blocks when this stage falls behind
+        self.queue_size = queue_size or workers * 2
+
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.busy_sec = 0.
+        self.blocked_sec = 0.
+        self.running = workers
+
+    def count(self, busy, blocked, error=False):
+        with self.lock:
+            self.processed += 1
+            self.busy_sec += busy
+            self.blocked_sec += blocked
+            if error:
+                self.errors += 1
+
+    def stats(self, elapsed):
+        return {
+            'workers': self.workers,
+            'processed': self.processed,
+            'errors': self.errors,
+            'per_sec': round(self.processed / elapsed, 2) if elapsed else 0,
+            # share of worker time spent in func; near 1.0 marks the bottleneck
+            'utilization': round(self.busy_sec / (elapsed * self.workers), 2) if elapsed else 0,
+            # time spent waiting on a full downstream queue (backpressure)
+            'blocked_sec': round(self.blocked_sec, 2),
+        }
+
+
+class Pipeline(object):
+    """
+    Runs items through stages connected by bounded queues, each stage on its own
+    threads. Output order is not preserved. Iterating run() yields the items
+    leaving the last stage; stats() gives per-stage throughput counters.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=st.queue_size) for st in stages]
+        self.out_queue = queue.Queue(maxsize=stages[-1].queue_size)
+        self.start_time = None
+
+    def _feed(self, items):
+        q = self.queues[0]
+        for item in items:
+            q.put(item)
+        for _ in range(self.stages[0].workers):
+            q.put(_DONE)
+
+    def _work(self, i):
+        stage = self.stages[i]
+        q_in = self.queues[i]
+        last = i + 1 == len(self.stages)
+        q_out = self.out_queue if last else self.queues[i + 1]
+        downstream_workers = 1 if last else self.stages[i + 1].workers
+
+        while True:
+            item = q_in.get()
+            if item is _DONE:
+                break
+            ts = time.time()
+            error = False
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                LOG.exception("{}: stage failed on {}: {}".format(stage.name, item, e))
+                result, error = None, True
+            busy = time.time() - ts
+            ts = time.time()
+            if result is not None:
+                q_out.put(result)
+            stage.count(busy, time.time() - ts, error=error)
+
+        # last worker of this stage closes the next one
+        with stage.lock:
+            stage.running -= 1
+            closing = stage.running == 0
+        if closing:
+            for _ in range(downstream_workers):
+                q_out.put(_DONE)
+
+    def run(self, items):
+        self.start_time = time.time()
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for i, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(i,), daemon=True,
+                                                name='{}-{}'.format(stage.name, n)))
+        for t in threads:
+            t.start()
+
+        while True:
+            item = self.out_queue.get()
+            if item is _DONE:
+                break
+            yield item
+
+        for t in threads:
+            t.join()
+
+    def stats(self):
+        elapsed = time.time() - self.start_time if self.start_time else 0
+        return {st.name: st.stats(elapsed) for st in self.stages}
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import heapq
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from api.const import CATEGORY_WEIGHTS, PRIORITY_MISSING, PRIORITY_RECENT, PRIORITY_RECENT_HALF_LIFE
+
+LOG = logging.getLogger(__name__)
+
+
+def _age_days(updated_at, now):
+    # updated_at: ISO time from pages.get_meta; None if unknown
+    try:
+        t = datetime.fromisoformat(str(updated_at).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return max(0., (now - t).total_seconds() / 86400.)
+
+
+def page_priority(page, meta, in_target, category_weights=CATEGORY_WEIGHTS, now=None):
+    """
+    Priority score of a page, higher first.
+
+    Args:
+        page: page name
+        meta: source page metadata (pages.get_meta), None if unknown
+        in_target: False if the page does not exist in the target site; None if unknown
+        category_weights: category -> weight multiplier
+        now: current time (utc datetime)
+
+    Returns: score
+    """
+    score = 1.
+    if in_target is False:
+        score += PRIORITY_MISSING
+    age = _age_days((meta or {}).get('updated_at'), now or datetime.now(timezone.utc))
+    if age is not None:
+        score += PRIORITY_RECENT * 0.5 ** (age / PRIORITY_RECENT_HALF_LIFE)
+    category = page.split(':')[0] if ':' in page else '_default'
+    return score * category_weights.get(category, 1)
+
+
+def prioritize_pages(pages, metas, target_pages=None, category_weights=CATEGORY_WEIGHTS, now=None):
+    """
+    Order pages so the most valuable updates come first: missing in target, recently
+    edited, heavier categories. A parent (parent_fullname) always comes before its
+    children and is pulled forward by its most urgent child.
+    Ties keep the original order.
+
+    Args:
+        pages: page names
+        metas: dictionary page -> source page metadata
+        target_pages: set of pages in the target site; None if unknown
+        category_weights: category -> weight multiplier
+
+    Returns: (ordered pages, dictionary page -> score)
+    """
+    order = {p: i for i, p in enumerate(pages)}
+    scores = {}
+    for p in pages:
+        in_target = None if target_pages is None else p in target_pages
+        scores[p] = page_priority(p, metas.get(p), in_target, category_weights=category_weights, now=now)
+
+    parent = {}
+    children = {}
+    for p in pages:
+        par = (metas.get(p) or {}).get('parent_fullname')
+        if par and par in order and par != p:
+            parent[p] = par
+            children.setdefault(par, []).append(p)
+
+    # a parent is as urgent as its most urgent descendant
+    effective = dict(scores)
+    for p in pages:
+        seen = set()
+        q = parent.get(p)
+        while q is not None and q not in seen:
+            seen.add(q)
+            if effective[q] >= effective[p]:
+                break
+            effective[q] = effective[p]
+            q = parent.get(q)
+
+    # pages whose parent is scheduled (or not in this run) become ready; most urgent first
+    heap = [(-effective[p], order[p], p) for p in pages if p not in parent]
+    heapq.heapify(heap)
+    ordered = []
+    while heap:
+        _, _, p = heapq.heappop(heap)
+        ordered.append(p)
+        for c in children.get(p, []):
+            heapq.heappush(heap, (-effective[c], order[c], c))
+
+    # parent cycles never become ready: append them in their original order
+    if len(ordered) < len(pages):
+        placed = set(ordered)
+        ordered.extend(p for p in pages if p not in placed)
+    return ordered, scores
+
+
+class ParentGate(object):
+    """
+    Hands out pages in order, holding a child back until its parent has finished,
+    so a child is never saved before its parent exists in the target.
+
+    Workers never wait: the consumer of iter() (the thread submitting work) does,
+    and only while every remaining page is a child of a page still in flight.
+    Whoever finishes a page calls done() (from any thread). Pages must come
+    parents first (prioritize_pages); a child whose parent is later in the list
+    (a parent cycle) is not held.
+
+        gate = ParentGate(parents)
+        for p in gate.iter(pages): submit p ... and on completion gate.done(p)
+    """
+
+    def __init__(self, parents):
+        # parents: child -> parent, both in this run
+        self.parents = parents
+        self.cond = threading.Condition()
+        self.seen = set()
+        self.finished = set()
+        self.held = {}
+        self.ready = deque()
+
+    def _blocked(self, page):
+        parent = self.parents.get(page)
+        return parent is not None and parent in self.seen and parent not in self.finished
+
+    def iter(self, pages):
+        pages = iter(pages)
+        exhausted = False
+        while True:
+            with self.cond:
+                page = None
+                while page is None:
+                    if self.ready:
+                        page = self.ready.popleft()
+                    elif not exhausted:
+                        page = next(pages, None)
+                        if page is None:
+                            exhausted = True
+                            continue
+                        self.seen.add(page)
+                        if self._blocked(page):
+                            self.held.setdefault(self.parents[page], []).append(page)
+                            page = None
+                    elif self.held:
+                        self.cond.wait()
+                    else:
+                        return
+            yield page
+
+    def done(self, page):
+        with self.cond:
+            self.finished.add(page)
+            self.ready.extend(self.held.pop(page, []))
+            self.cond.notify_all()
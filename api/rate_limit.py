@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+
+from api.const import API_RATE_PER_MIN, API_BURST, API_MIN_RATE_PER_MIN
+
+LOG = logging.getLogger(__name__)
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket.
+
+    Tokens refill continuously at `rate` per second up to `burst`. Each request
+    takes one token and blocks until one is available, so short bursts go out
+    immediately while the sustained rate never exceeds `rate`.
+
+    The rate adapts: penalize() halves it (down to min_rate) when the server
+    reports rate limiting, reward() creeps back towards the configured rate.
+    """
+
+    # share of the configured rate regained per successful request
+    RECOVERY_STEP = 0.01
+
+    def __init__(self, rate, burst, min_rate=None):
+        self.rate = float(rate)
+        self.max_rate = float(rate)
+        self.min_rate = float(min_rate) if min_rate else self.max_rate / 8
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def penalize(self, factor=0.5):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * factor)
+            # drop the burst allowance too, the server has just told us to slow down
+            self.tokens = min(self.tokens, 0.)
+            LOG.warning("Rate limited: lowering request rate to {:.2f}/sec".format(self.rate))
+
+    def reward(self):
+        if self.rate >= self.max_rate:
+            return
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * self.RECOVERY_STEP)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+
+    def try_acquire(self, tokens=1):
+        # take tokens if available and return 0; otherwise return seconds to wait before retrying
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        # block until tokens are available. return seconds waited.
+        waited = 0.
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+
+# one bucket per wikidot user: the quota is per user, not per WikidotAPI instance
+_shared_limiters = {}
+_shared_limiters_lock = threading.Lock()
+
+
+def shared_limiter(key, rate=API_RATE_PER_MIN / 60., burst=API_BURST, min_rate=API_MIN_RATE_PER_MIN / 60.,
+                   shards=1):
+    # shards: number of processes/machines running on the same credential (--shard i/N);
+    # each gets 1/N of the quota so together they stay within it
+    if shards > 1:
+        rate, burst, min_rate = rate / shards, max(1, burst // shards), min_rate / shards
+    with _shared_limiters_lock:
+        if key not in _shared_limiters:
+            LOG.debug("Creating rate limiter for {}: {}/sec, burst {}".format(key, rate, burst))
+            _shared_limiters[key] = TokenBucket(rate, burst, min_rate=min_rate)
+        return _shared_limiters[key]
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import http.client
+import logging
+import random
+import socket
+from xmlrpc.client import Fault, ProtocolError
+
+from api.const import API_RETRY_ATTEMPTS, API_RETRY_BASE_DELAY, API_RETRY_MAX_DELAY
+
+LOG = logging.getLogger(__name__)
+
+# failure classes
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'
+PERMANENT = 'permanent'
+
+RATE_LIMIT_MARKERS = ('rate limit', 'too many', 'try again later')
+
+
+def classify_error(e):
+    """
+    Classify an api call failure.
+
+    Returns: RATE_LIMITED (slow down and retry), TRANSIENT (retry) or
+    PERMANENT (retrying won't help: missing page, bad request, permissions)
+    """
+    if isinstance(e, Fault):
+        message = str(e.faultString).lower()
+        if e.faultCode == 429 or any(m in message for m in RATE_LIMIT_MARKERS):
+            return RATE_LIMITED
+        if isinstance(e.faultCode, int) and e.faultCode >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(e, ProtocolError):
+        if e.errcode == 429:
+            return RATE_LIMITED
+        if e.errcode >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(e, (ConnectionError, socket.timeout, http.client.HTTPException, OSError)):
+        return TRANSIENT
+    return PERMANENT
+
+
+class RetryPolicy(object):
+    """
+    Retry decisions and delays for api calls: rate-limited and transient failures
+    are retried up to max_attempts with full-jitter exponential backoff.
+    """
+
+    def __init__(self, max_attempts=API_RETRY_ATTEMPTS, base_delay=API_RETRY_BASE_DELAY,
+                 max_delay=API_RETRY_MAX_DELAY):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def should_retry(self, kind, attempt):
+        # attempt: 1-based number of the attempt that just failed
+        return kind != PERMANENT and attempt < self.max_attempts
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
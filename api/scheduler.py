@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+import uuid
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+LOG = logging.getLogger(__name__)
+
+
+def bounded_map(func, iterable, max_workers, max_in_flight=None, executor=None):
+    """
+    Run func over iterable on a thread pool, yielding results in input order.
+
+    At most max_in_flight calls are submitted ahead of the consumer, so memory
+    stays bounded and the caller can process results as they complete in order.
+    func should handle its own exceptions; an uncaught one is raised on yield.
+    An existing executor (e.g. a ProcessPoolExecutor) can be passed in; it is
+    left open for the caller to shut down.
+    """
+    if max_in_flight is None:
+        max_in_flight = max_workers * 2
+
+    if executor is not None:
+        for r in _submit_bounded(executor, func, iterable, max_in_flight):
+            yield r
+        return
+
+    if max_workers <= 1:
+        for item in iterable:
+            yield func(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for r in _submit_bounded(executor, func, iterable, max_in_flight):
+            yield r
+
+
+def _submit_bounded(executor, func, iterable, max_in_flight):
+    in_flight = deque()
+    for item in iterable:
+        in_flight.append(executor.submit(func, item))
+        if len(in_flight) >= max_in_flight:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue(object):
+    """
+    Bounded background job queue for the service.
+
+    Jobs run on max_workers threads; at most max_pending jobs may wait or run at
+    once and submit raises QueueFull beyond that. The status of the last
+    `history` jobs is kept for polling.
+    """
+
+    def __init__(self, max_workers=1, max_pending=4, history=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.max_pending = max_pending
+        self.history = history
+        self.jobs = OrderedDict()
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def submit(self, name, func, *args, **kwargs):
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise QueueFull("{} jobs pending".format(self.pending))
+            self.pending += 1
+            job_id = uuid.uuid4().hex[:12]
+            self.jobs[job_id] = {'id': job_id, 'name': name, 'status': 'queued', 'submitted_at': time.time(),
+                                 'started_at': None, 'finished_at': None, 'result': None, 'error': None}
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+        self.executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, func, args, kwargs):
+        job = self.jobs.get(job_id, {})
+        job.update(status='running', started_at=time.time())
+        try:
+            job['result'] = func(*args, **kwargs)
+            job['status'] = 'done'
+        except Exception as e:
+            LOG.exception("Job {} failed".format(job_id))
+            job.update(status='failed', error=str(e))
+        finally:
+            job['finished_at'] = time.time()
+            with self.lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self):
+        with self.lock:
+            return [dict(j, result=None) for j in self.jobs.values()]
@@ -9,15 +9,21 @@ import traceback
 
 from functools import wraps
 
+from api.metrics import METRICS
+
 LOG = logging.getLogger(__name__)
 
 
 class SlackWebHook(object):
 
     WEBHOOK_URL = 'INSERT_YOUR_SLACK_WEBHOOK_URL_HERE'
+    # sharded runs mute their own messages and report once through merge_reports
+    MUTED = False
 
     @staticmethod
     def post_message(data, channel=None, username=None, icon_emoji=None, data_fallback={}):
+        if SlackWebHook.MUTED:
+            return
 
         if channel:
             data['channel'] = channel
@@ -46,7 +52,8 @@ class SlackWebHook(object):
 
 
 # notification wrapper
-def notify_status(job_name='test-job-name', channel='_status_', icon_emoji=':loudspeaker:'):
+# with_metrics: append the api metrics summary to the report (for whole-job functions)
+def notify_status(job_name='test-job-name', channel='_status_', icon_emoji=':loudspeaker:', with_metrics=False):
     def decorator(func):
 
         def wrapper(*args, **kwargs):
@@ -66,6 +73,9 @@ def notify_status(job_name='test-job-name', channel='_status_', icon_emoji=':lou
                     result_log = result.get('err', result.get('log', result.get('log_text', '')))
                     if result.get('log_text_lines', []):
                         result_log = '\n'.join(result['log_text_lines'])
+                    if with_metrics and METRICS.total_calls():
+                        result['api_metrics'] = METRICS.summary()
+                        result_log += '\n' + METRICS.report_text()
                     print(result_log)
 
                 text_end = '[{}] {}\n----\n{}\n----\nTook: {:.2f} secs\n'.format(
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+import sqlite3
+import time
+
+from api.const import PATH_SYNC_STATE
+
+LOG = logging.getLogger(__name__)
+
+
+class SyncState(object):
+    """
+    Local record of the last successful sync of each page, kept in SQLite.
+
+    A page needs work when its source revision moved since the last sync, when
+    the target was edited (its revision moved) after we last saved it, when it
+    was converted with a different exception dict, or when no target hash was
+    recorded (the last save was never confirmed).
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS page_state (
+        from_site TEXT NOT NULL,
+        to_site TEXT NOT NULL,
+        page TEXT NOT NULL,
+        source_revision INTEGER,
+        source_updated_at TEXT,
+        target_revision INTEGER,
+        target_updated_at TEXT,
+        content_hash TEXT,
+        target_hash TEXT,
+        synced_at REAL,
+        exception_digest TEXT,
+        PRIMARY KEY (from_site, to_site, page)
+    )
+    """
+    COLUMNS = ['from_site', 'to_site', 'page', 'source_revision', 'source_updated_at', 'target_revision',
+               'target_updated_at', 'content_hash', 'target_hash', 'synced_at', 'exception_digest']
+    STATE_COLUMNS = COLUMNS[3:9] + ['exception_digest']
+
+    def __init__(self, from_site, to_site, path=PATH_SYNC_STATE):
+        self.from_site = from_site
+        self.to_site = to_site
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(self.SCHEMA)
+        # state files written before exception_digest was recorded
+        columns = [r[1] for r in self.conn.execute('PRAGMA table_info(page_state)')]
+        if 'exception_digest' not in columns:
+            self.conn.execute('ALTER TABLE page_state ADD COLUMN exception_digest TEXT')
+        self.conn.commit()
+
+    def get(self, page):
+        row = self.conn.execute(
+            'SELECT {} FROM page_state WHERE from_site=? AND to_site=? AND page=?'.format(
+                ', '.join(self.STATE_COLUMNS)),
+            (self.from_site, self.to_site, page)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self.STATE_COLUMNS, row))
+
+    def all(self):
+        rows = self.conn.execute(
+            'SELECT page, {} FROM page_state WHERE from_site=? AND to_site=?'.format(', '.join(self.STATE_COLUMNS)),
+            (self.from_site, self.to_site))
+        return {r[0]: dict(zip(self.STATE_COLUMNS, r[1:])) for r in rows}
+
+    def needs_sync(self, page, meta_from, meta_to, state=None, digest=None):
+        """
+        Args:
+            page: page name
+            meta_from: source page metadata (pages.get_meta)
+            meta_to: target page metadata, None if the page does not exist in target
+            state: stored state, looked up if not given
+            digest: digest of the exception dict of this run (ExceptionMatcher.digest)
+
+        Returns: reason string if the page needs sync; None otherwise
+        """
+        if state is None:
+            state = self.get(page)
+        if not state:
+            return 'new'
+        if meta_to is None:
+            return 'missing in target'
+        if meta_from.get('revisions') != state['source_revision'] \
+                or meta_from.get('updated_at') != state['source_updated_at']:
+            return 'source changed'
+        if meta_to.get('revisions') != state['target_revision'] \
+                or meta_to.get('updated_at') != state['target_updated_at']:
+            return 'target drifted'
+        if digest is not None and digest != state.get('exception_digest'):
+            return 'exceptions changed'
+        # no hash means the last save was never confirmed
+        if not state.get('target_hash'):
+            return 'target unverified'
+        return None
+
+    def record(self, page, meta_from, meta_to, content_hash, target_hash, exception_digest=None):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO page_state ({}) VALUES ({})'.format(
+                ', '.join(self.COLUMNS), ', '.join('?' * len(self.COLUMNS))),
+            (self.from_site, self.to_site, page,
+             meta_from.get('revisions'), meta_from.get('updated_at'),
+             (meta_to or {}).get('revisions'), (meta_to or {}).get('updated_at'),
+             content_hash, target_hash, time.time(), exception_digest))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
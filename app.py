@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+HTTP service for Cloud Run / gunicorn, keeping the converter warm between requests:
+
+    gunicorn --config gunicorn.conf.py app:app
+
+Each worker process loads OpenCC, the compiled exception matcher, the conversion cache
+and an authorized WikidotAPI (keep-alive connection per thread) once; requests reuse them.
+
+POST /convert        {"text": "..."}                            -> {"text": "..."}
+POST /convert_page   {"page": "cat:name", "save": true}         -> convert_and_save_page report
+POST /jobs           {"action": "convert_site", "category": [...], "page": ..., "incremental": false}
+                                                                -> 202 {"id": ...}
+GET  /jobs, /jobs/<id>                                          -> job status
+GET  /metrics, /metrics.json, /healthz
+
+If SERVICE_TOKEN is set in the environment, requests must send "Authorization: Bearer <token>".
+Without it the endpoints that write to the target site (/convert_page with save, POST /jobs) answer 403.
+Metrics and jobs are per process; run a single worker (with threads) for a complete view.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+from xmlrpc.client import Fault, ProtocolError
+
+from flask import Flask, Response, request, abort
+
+from api.const import LOGGING_FORMAT, FROM_SITE, TO_SITE, PATH_CONVERT_EXCEPTION, PATH_CONVERT_CACHE, \
+    PATH_SYNC_STATE, SERVICE_JOB_WORKERS, SERVICE_MAX_PENDING_JOBS, SERVICE_MAX_CONCURRENT, \
+    SERVICE_ACQUIRE_TIMEOUT
+from api.metrics import METRICS
+from api.retry import classify_error, PERMANENT, RATE_LIMITED
+from api.scheduler import JobQueue, QueueFull
+from api.wikidot_api import WikidotAPI
+from convert.cache import enable_cache
+from convert.matcher import compile_exception_dict
+from convert.page import build_page_to_save
+from convert.sc_to_tc import convert_to_tc, preload_converter
+from wikidot import convert_and_save_page, copy_pages
+
+logging.basicConfig(format=LOGGING_FORMAT, level=logging.INFO)
+LOG = logging.getLogger(__name__)
+
+app = Flask(__name__)
+
+
+class WarmService(object):
+    # per-process state shared by all requests of a worker
+
+    def __init__(self):
+        preload_converter()
+        expt = {}
+        if os.path.exists(PATH_CONVERT_EXCEPTION):
+            expt = json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8'))
+        self.matcher = compile_exception_dict(expt)
+        if os.getenv('SERVICE_NO_CACHE') is None:
+            enable_cache(path=os.getenv('SERVICE_CACHE', PATH_CONVERT_CACHE))
+        self.api = WikidotAPI(permission='rw')
+        self.jobs = JobQueue(max_workers=SERVICE_JOB_WORKERS, max_pending=SERVICE_MAX_PENDING_JOBS)
+        self.slots = threading.BoundedSemaphore(SERVICE_MAX_CONCURRENT)
+        LOG.info("Service warm: {} exceptions, api {}".format(len(self.matcher), self.api.api_path.split('@')[-1]))
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    # built once per worker (gunicorn.conf.py warms it up right after fork)
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = WarmService()
+    return _service
+
+
+@app.before_request
+def check_token():
+    token = os.getenv('SERVICE_TOKEN')
+    if token and request.endpoint != 'healthz' and request.headers.get('Authorization') != 'Bearer {}'.format(token):
+        abort(401)
+
+
+def _require_token():
+    # writes go through the rw key: never serve them unauthenticated
+    if not os.getenv('SERVICE_TOKEN'):
+        abort(403, "Write endpoints are disabled: SERVICE_TOKEN is not set")
+
+
+class _Slot(object):
+    # limits concurrent conversions in a worker; 503 if no slot frees up in time
+    def __enter__(self):
+        if not get_service().slots.acquire(timeout=SERVICE_ACQUIRE_TIMEOUT):
+            abort(503, "Too many concurrent requests")
+
+    def __exit__(self, *exc):
+        get_service().slots.release()
+
+
+def _abort_upstream(page, e):
+    # api failure -> 404 for a missing page, 503 when rate limited, 502 for other upstream errors
+    kind = classify_error(e)
+    LOG.warning("{}: api error ({}): {}".format(page, kind, e))
+    if kind == PERMANENT and isinstance(e, Fault):
+        abort(404, "Page {} not found".format(page))
+    abort(503 if kind == RATE_LIMITED else 502, "Upstream api error: {}".format(e))
+
+
+def _json_body(*required):
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, "Expected a json object")
+    for k in required:
+        if not body.get(k):
+            abort(400, "Missing '{}'".format(k))
+    return body
+
+
+@app.route('/convert', methods=['POST'])
+def convert_text():
+    body = _json_body('text')
+    with _Slot():
+        return {'text': convert_to_tc(body['text'], except_dict=get_service().matcher)}
+
+
+@app.route('/convert_page', methods=['POST'])
+def convert_page():
+    # save=false returns the converted page without writing it to the target site
+    body = _json_body('page')
+    service = get_service()
+    from_site = body.get('from_site', FROM_SITE)
+    to_site = body.get('to_site', TO_SITE)
+    save = body.get('save', True)
+    if save:
+        _require_token()
+    with _Slot():
+        try:
+            if not save:
+                page_from = service.api.get_single_page(from_site, body['page'])
+                page_to_save, converted = build_page_to_save(page_from, to_site, expt=service.matcher)
+                return {'converted': converted, 'page': page_to_save}
+            return convert_and_save_page(service.api, from_site, to_site, body['page'], convert=True,
+                                         expt=service.matcher)
+        except (Fault, ProtocolError, OSError) as e:
+            _abort_upstream(body['page'], e)
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    body = _json_body('action')
+    _require_token()
+    service = get_service()
+    if body['action'] != 'convert_site':
+        abort(400, "Unsupported action: {}".format(body['action']))
+    categories = body.get('category')
+    if isinstance(categories, str):
+        categories = [categories]
+    try:
+        job_id = service.jobs.submit(
+            'convert_site', copy_pages, service.api, FROM_SITE, TO_SITE,
+            categories=categories, page=body.get('page'), convert=True, exception=service.matcher,
+            incremental=bool(body.get('incremental')), state_path=PATH_SYNC_STATE, report_pages=False)
+    except QueueFull as e:
+        abort(429, str(e))
+    return service.jobs.get(job_id), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    return {'jobs': get_service().jobs.list()}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = get_service().jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format
+    return Response(METRICS.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/metrics.json')
+def metrics_json():
+    return METRICS.summary()
+
+
+@app.route('/healthz')
+def healthz():
+    return 'ok'
@@ -0,0 +1 @@
+__all__ = ['bench_convert', 'bench_index', 'bench_load', 'fake_server']
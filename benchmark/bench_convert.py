@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import time
+
+from convert.sc_to_tc import convert_to_tc, preload_converter, OPENCC_CONFIG
+
+"""
+Micro-benchmark of convert_to_tc per-call latency.
+
+Compares building a fresh OpenCC converter on every call (old behaviour)
+against the shared warm converter.
+
+Usage:
+python -m benchmark.bench_convert [--calls 50] [--repeat 20]
+"""
+
+SAMPLE_TEXT = u'这是一个简体中文的测试页面。乐队的专辑与单曲信息，以及演出的时间和地点。'
+
+
+def convert_cold(content):
+    # behaviour before the shared converter: reload dictionaries every call
+    from opencc import OpenCC
+    return OpenCC(OPENCC_CONFIG).convert(content)
+
+
+def time_calls(func, content, calls):
+    ts = time.perf_counter()
+    for _ in range(calls):
+        func(content)
+    return (time.perf_counter() - ts) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--calls', action='store', type=int, default=50, help='calls per measurement')
+    parser.add_argument('--repeat', action='store', type=int, default=20, help='sample text repeat count')
+    args = parser.parse_args()
+
+    content = SAMPLE_TEXT * args.repeat
+
+    ts = time.perf_counter()
+    preload_converter()
+    print('preload: {:.2f} ms'.format((time.perf_counter() - ts) * 1000))
+
+    cold = time_calls(convert_cold, content, args.calls)
+    warm = time_calls(convert_to_tc, content, args.calls)
+    print('cold (new OpenCC per call): {:.3f} ms/call'.format(cold * 1000))
+    print('warm (shared converter):    {:.3f} ms/call'.format(warm * 1000))
+    print('speedup: {:.1f}x'.format(cold / warm if warm else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import gc
+import tracemalloc
+
+from api.page_index import PageIndex
+
+"""
+Memory per page of whole-site page data held by compare_sites / convert_site.
+
+Compares lists of page names plus dictionaries of page metadata (before) against
+PageIndex (interned names, __slots__ records, int ids), for two sites listing the
+same pages. Names are built fresh per site, as they arrive from the api.
+
+Usage:
+python -m benchmark.bench_index [--pages 100000]
+"""
+
+CATEGORIES = ['song', 'video', 'news', 'goods', 'play', 'line']
+
+
+def site_listing(n):
+    # new string objects on every call, like two separate pages.select responses
+    names = [''.join([CATEGORIES[i % len(CATEGORIES)], ':', 'some-page-name-', str(i)]) for i in range(n)]
+    metas = [(name, {'fullname': name, 'revisions': i % 50, 'updated_at': '2020-01-{:02d}T00:00:00+00:00'.format(
+        i % 28 + 1), 'parent_fullname': None, 'title': 'title {}'.format(i), 'tags': []})
+             for i, name in enumerate(names)]
+    return names, metas
+
+
+def build_lists(n):
+    from_pages, from_metas = site_listing(n)
+    to_pages, to_metas = site_listing(n)
+    return (from_pages, to_pages, dict(from_metas), dict(to_metas),
+            list(set(to_pages) - set(from_pages)), list(set(from_pages) - set(to_pages)))
+
+
+def build_index(n):
+    from_pages, from_metas = site_listing(n)
+    from_index = PageIndex.from_pages('from', from_pages, from_metas)
+    del from_pages, from_metas
+    to_pages, to_metas = site_listing(n)
+    to_index = PageIndex.from_pages('to', to_pages, to_metas)
+    del to_pages, to_metas
+    return (from_index, to_index, from_index.ids() - to_index.ids(), to_index.ids() - from_index.ids())
+
+
+def measure(func, n):
+    gc.collect()
+    tracemalloc.start()
+    kept = func(n)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pages', action='store', type=int, default=100000)
+    args = parser.parse_args()
+
+    print('{:<12} {:>14} {:>14}'.format('structure', 'bytes/page', 'peak bytes/page'))
+    for name, func in (('lists+dicts', build_lists), ('PageIndex', build_index)):
+        current, peak = measure(func, args.pages)
+        print('{:<12} {:>14.0f} {:>14.0f}'.format(name, current / args.pages, peak / args.pages))
+
+
+if __name__ == '__main__':
+    main()
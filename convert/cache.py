@@ -0,0 +1,202 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import atexit
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from api.const import PATH_CONVERT_CACHE, CONVERT_CACHE_SIZE, CONVERT_CACHE_DISK_ROWS
+
+LOG = logging.getLogger(__name__)
+
+
+class ConversionCache(object):
+    """
+    Content-addressed cache of converted text.
+
+    Keys are hash(source text, OpenCC config, exception-dict digest), so editing
+    convert_exception.json never serves stale output. Lookups go to an in-memory
+    LRU first, then to a SQLite file that survives between runs. Entries written
+    under an older exception digest are dropped the first time a new digest is seen,
+    and the file keeps at most max_rows entries: the oldest written are pruned on
+    close() and every PRUNE_EVERY puts.
+
+    Several processes may share the file (convert_archive, pipeline workers): it is
+    opened in WAL mode with a busy timeout, and they pass commit_every=1 so no
+    process holds the write lock between puts or loses puts when it exits without close().
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS conversion (
+        key TEXT PRIMARY KEY,
+        digest TEXT NOT NULL,
+        value TEXT NOT NULL
+    )
+    """
+    COMMIT_EVERY = 100
+    SELECT_CHUNK = 500  # stays under sqlite's host parameter limit
+    BUSY_TIMEOUT = 30  # seconds to wait for another process's write lock
+    PRUNE_EVERY = 10000
+
+    def __init__(self, path=PATH_CONVERT_CACHE, max_items=CONVERT_CACHE_SIZE, commit_every=COMMIT_EVERY,
+                 max_rows=CONVERT_CACHE_DISK_ROWS):
+        self.path = path
+        self.max_items = max_items
+        self.commit_every = commit_every
+        self.max_rows = max_rows
+        self.unpruned = 0
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.digests = set()
+        self.pending = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.conn = None
+        if path:
+            self.conn = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+            # readers do not block the writer (and the other way round) across processes
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(self.SCHEMA)
+            self.conn.commit()
+
+    @staticmethod
+    def key(text, config, digest):
+        h = hashlib.sha1()
+        for part in (config, digest, text):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def _prune_digest(self, digest):
+        # exception dict changed since entries were written: drop them once per digest
+        if digest in self.digests:
+            return
+        self.digests.add(digest)
+        if self.conn is not None:
+            c = self.conn.execute('DELETE FROM conversion WHERE digest != ?', (digest,))
+            if c.rowcount:
+                LOG.info("Conversion cache: dropped {} entries of older exception dicts.".format(c.rowcount))
+            self.conn.commit()
+
+    def _prune_size(self):
+        # INSERT OR REPLACE gives rewritten keys a new rowid, so rowid order is write order
+        self.unpruned = 0
+        if self.conn is None or not self.max_rows:
+            return
+        try:
+            c = self.conn.execute(
+                'DELETE FROM conversion WHERE rowid <= '
+                '(SELECT rowid FROM conversion ORDER BY rowid DESC LIMIT 1 OFFSET ?)', (self.max_rows,))
+            self.conn.commit()
+        except sqlite3.OperationalError as e:
+            # another process holds the write lock for too long; try again next time
+            LOG.warning("Conversion cache: could not prune {}: {}".format(self.path, e))
+            return
+        if c.rowcount:
+            LOG.info("Conversion cache: pruned {} oldest entries.".format(c.rowcount))
+
+    def _written(self, n):
+        self.pending += n
+        self.unpruned += n
+        if self.pending >= self.commit_every:
+            self.conn.commit()
+            self.pending = 0
+        if self.unpruned >= self.PRUNE_EVERY:
+            self._prune_size()
+
+    def get(self, text, config, digest):
+        k = self.key(text, config, digest)
+        with self.lock:
+            self._prune_digest(digest)
+            if k in self.memory:
+                self.memory.move_to_end(k)
+                self.hits += 1
+                return self.memory[k]
+            if self.conn is not None:
+                row = self.conn.execute('SELECT value FROM conversion WHERE key = ?', (k,)).fetchone()
+                if row is not None:
+                    self._remember(k, row[0])
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+        return None
+
+    def put(self, text, config, digest, value):
+        k = self.key(text, config, digest)
+        with self.lock:
+            self._remember(k, value)
+            if self.conn is not None:
+                self.conn.execute('INSERT OR REPLACE INTO conversion VALUES (?, ?, ?)', (k, digest, value))
+                self._written(1)
+
+    def get_many(self, texts, config, digest):
+        # batch lookup (e.g. the lines of a page); returns {text: value} for the hits
+        keys = {self.key(t, config, digest): t for t in texts}
+        found = {}
+        with self.lock:
+            self._prune_digest(digest)
+            missing = []
+            for k, t in keys.items():
+                if k in self.memory:
+                    self.memory.move_to_end(k)
+                    found[t] = self.memory[k]
+                else:
+                    missing.append(k)
+            if self.conn is not None:
+                for i in range(0, len(missing), self.SELECT_CHUNK):
+                    chunk = missing[i:i + self.SELECT_CHUNK]
+                    rows = self.conn.execute('SELECT key, value FROM conversion WHERE key IN ({})'.format(
+                        ','.join('?' * len(chunk))), chunk).fetchall()
+                    for k, value in rows:
+                        self._remember(k, value)
+                        found[keys[k]] = value
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, pairs, config, digest):
+        # pairs: [(text, value)]
+        rows = [(self.key(t, config, digest), digest, v) for t, v in pairs]
+        with self.lock:
+            for k, _, v in rows:
+                self._remember(k, v)
+            if self.conn is not None and rows:
+                self.conn.executemany('INSERT OR REPLACE INTO conversion VALUES (?, ?, ?)', rows)
+                self._written(len(rows))
+
+    def _remember(self, k, value):
+        self.memory[k] = value
+        self.memory.move_to_end(k)
+        while len(self.memory) > self.max_items:
+            self.memory.popitem(last=False)
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.commit()
+                self._prune_size()
+                self.conn.close()
+                self.conn = None
+        LOG.info("Conversion cache: {} hits, {} misses.".format(self.hits, self.misses))
+
+
+# process-wide cache used by convert_to_tc once enabled
+_cache = None
+
+
+def enable_cache(path=PATH_CONVERT_CACHE, max_items=CONVERT_CACHE_SIZE, commit_every=ConversionCache.COMMIT_EVERY,
+                 max_rows=CONVERT_CACHE_DISK_ROWS):
+    # path=None keeps the in-memory tier only
+    global _cache
+    if _cache is None:
+        _cache = ConversionCache(path=path, max_items=max_items, commit_every=commit_every, max_rows=max_rows)
+        atexit.register(_cache.close)
+    return _cache
+
+
+def get_cache():
+    return _cache
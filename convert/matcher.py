@@ -0,0 +1,150 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+LOG = logging.getLogger(__name__)
+
+
+def _dict_digest(exception_dict, ordered):
+    payload = json.dumps(exception_dict or {}, sort_keys=True, ensure_ascii=False)
+    if ordered:
+        # key order matters for chained replacements
+        payload += json.dumps(list(exception_dict or {}), ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def exception_digest(exception_dict):
+    # identifies one version of the exception dict and how it is applied (used by the conversion cache).
+    # a plain dict is applied key by key, same as ordered=True.
+    if isinstance(exception_dict, ExceptionMatcher):
+        return exception_dict.digest
+    return _dict_digest(exception_dict, True)
+
+
+class ExceptionMatcher(object):
+    """
+    Compiled multi-pattern replacer for the conversion exception dict.
+
+    Default mode builds an Aho-Corasick automaton over the dict keys and rewrites
+    the input in one pass, replacing the leftmost-longest match at each position.
+    Replaced text is never scanned again.
+
+    ordered=True reproduces the legacy behaviour of replace_token_by_dict: one
+    str.replace per key in dict order, so later keys see earlier replacements.
+    """
+
+    def __init__(self, exception_dict, ordered=False):
+        self.exception_dict = dict(exception_dict)
+        self.ordered = ordered
+        self.digest = _dict_digest(self.exception_dict, ordered)
+        # a key or value with a line break can match across lines (see sc_to_tc._spans_lines)
+        self.spans_lines = any('\n' in k or '\n' in v for k, v in self.exception_dict.items())
+
+        # automaton: node id -> transitions / failure link / depth / longest match (length, value)
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        self._match = [None]
+        if not ordered:
+            self._build()
+
+    def __len__(self):
+        return len(self.exception_dict)
+
+    def __repr__(self):
+        return 'ExceptionMatcher({} keys, ordered={}, digest={})'.format(
+            len(self.exception_dict), self.ordered, self.digest[:8])
+
+    def _build(self):
+        goto, depth, match = self._goto, self._depth, self._match
+        for k, v in self.exception_dict.items():
+            if not k:
+                continue
+            node = 0
+            for ch in k:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    depth.append(depth[node] + 1)
+                    match.append(None)
+                    goto[node][ch] = nxt
+                node = nxt
+            match[node] = (len(k), v)
+
+        fail = self._fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for node in queue:
+            for ch, nxt in goto[node].items():
+                f = fail[node]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[nxt] = f if f != nxt else 0
+                # node without its own key inherits the longest suffix match
+                if match[nxt] is None:
+                    match[nxt] = match[fail[nxt]]
+                queue.append(nxt)
+
+    def replace(self, input_str):
+        if not input_str or not self.exception_dict:
+            return input_str
+        if self.ordered:
+            return self._replace_ordered(input_str)
+
+        goto, fail, depth, match = self._goto, self._fail, self._depth, self._match
+        out = []
+        pos = 0
+        i = 0
+        n = len(input_str)
+        node = 0
+        # best pending match: (start, end, value)
+        cand = None
+        while True:
+            while i < n:
+                ch = input_str[i]
+                while node and ch not in goto[node]:
+                    node = fail[node]
+                node = goto[node].get(ch, 0)
+                i += 1
+
+                # no later match can start at or before the pending one: commit it
+                if cand is not None and i - depth[node] > cand[0]:
+                    break
+
+                m = match[node]
+                if m is not None:
+                    start = i - m[0]
+                    if cand is None or start < cand[0] or (start == cand[0] and i > cand[1]):
+                        cand = (start, i, m[1])
+
+            if cand is None:
+                break
+            LOG.debug("Detected replacement: {} to {}".format(input_str[cand[0]:cand[1]], cand[2]))
+            out.append(input_str[pos:cand[0]])
+            out.append(cand[2])
+            pos = i = cand[1]
+            node = 0
+            cand = None
+
+        out.append(input_str[pos:])
+        return ''.join(out)
+
+    def _replace_ordered(self, input_str):
+        output_str = input_str
+        for k, v in self.exception_dict.items():
+            if k in output_str:
+                LOG.debug("Detected replacement: {} to {}".format(k, v))
+                output_str = output_str.replace(k, v)
+        return output_str
+
+
+def compile_exception_dict(exception_dict, ordered=False):
+    # build the matcher once per run and pass it wherever an exception dict is expected.
+    if isinstance(exception_dict, ExceptionMatcher):
+        return exception_dict
+    matcher = ExceptionMatcher(exception_dict or {}, ordered=ordered)
+    LOG.info("Compiled {} conversion exceptions (ordered: {}).".format(len(matcher), ordered))
+    return matcher
@@ -0,0 +1,154 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from api.const import CONTENT_BROKEN_PAGES, TO_SITE, ARCHIVE_CONVERT_BATCH
+from api.scheduler import bounded_map
+from convert.cache import enable_cache
+from convert.matcher import compile_exception_dict
+from convert.page import build_page_to_save
+from convert.sc_to_tc import preload_converter
+from utility.archive import ArchiveReader, ArchiveWriter, decode_block
+
+LOG = logging.getLogger(__name__)
+
+# per worker process: compiled exception matcher, set by init_convert_worker
+_worker_expt = None
+
+
+def init_convert_worker(exception_dict, ordered, cache_path):
+    # one warm OpenCC instance and one compiled matcher per worker process
+    global _worker_expt
+    logging.getLogger().setLevel(logging.WARNING)
+    _worker_expt = compile_exception_dict(exception_dict, ordered=ordered)
+    if cache_path is not None:
+        # commit every put: workers share the file and never run the atexit close()
+        enable_cache(path=cache_path, commit_every=1)
+    preload_converter()
+
+
+def convert_batch(args):
+    batch, to_site, convert = args
+    out = []
+    for page, page_from in batch:
+        try:
+            page_to_save, converted = build_page_to_save(page_from, to_site, convert=convert, expt=_worker_expt)
+        except Exception as e:
+            LOG.error("{}: Failed processing due to exception: {}".format(page, e))
+            page_to_save, converted = None, False
+        out.append((page, page_to_save, converted))
+    return out
+
+
+def convert_block(args):
+    # a compressed archive block: decompressing and parsing run in the worker too
+    data, to_site, convert = args
+    batch = [(page, page_from) for page, page_from in decode_block(data) if page not in CONTENT_BROKEN_PAGES]
+    return convert_batch((batch, to_site, convert))
+
+
+def _blocks(reader, to_site, convert, skipped):
+    for pages, data in reader.iter_blocks():
+        skipped.extend(p for p in pages if p in CONTENT_BROKEN_PAGES)
+        yield data, to_site, convert
+
+
+def _batches(reader, batch_size, to_site, convert, skipped):
+    batch = []
+    for page, page_from in reader:
+        # same as copy_one_page: known broken pages are never saved
+        if page in CONTENT_BROKEN_PAGES:
+            skipped.append(page)
+            continue
+        batch.append((page, page_from))
+        if len(batch) >= batch_size:
+            yield batch, to_site, convert
+            batch = []
+    if batch:
+        yield batch, to_site, convert
+
+
+def convert_archive(input_path, output_path, exception={}, ordered=False, to_site=TO_SITE, convert=True,
+                    workers=None, cache_path=None, batch_size=ARCHIVE_CONVERT_BATCH):
+    """
+    Convert every page of an archive (from archive_site) without touching the API.
+
+    Output records are {page: page_to_save}, i.e. what copy_one_page would save.
+    Pages are streamed in batches to a process pool and written in input order;
+    at most 2 batches per worker are in memory at a time. Blocks of an indexed
+    .gz archive are handed to the workers still compressed, one block per task.
+
+    Args:
+        input_path: archive to read (.jsonl or block-compressed .jsonl.gz)
+        output_path: archive to write (block-compressed if it ends with .gz)
+        exception: conversion exception dict (plain dict, compiled in each worker)
+        ordered: apply exceptions in legacy key order
+        to_site: site name recorded in the pages to save
+        convert: False to only apply exceptions
+        workers: worker processes, defaults to cpu count
+        cache_path: conversion cache file shared by workers, None to disable
+        batch_size: pages per task for archives without an index
+
+    Returns: dictionary of option report
+
+    """
+    r = {
+        "pages_converted": [],
+        "pages_unconverted": [],
+        "pages_skipped": [],
+        "pages_failed": [],
+    }
+    workers = workers or os.cpu_count() or 1
+    if hasattr(exception, 'exception_dict'):
+        exception = exception.exception_dict
+
+    start_time = time.time()
+    reader = ArchiveReader(input_path)
+    if output_path.endswith('.gz'):
+        writer = ArchiveWriter(output_path)
+        write = writer.write
+    else:
+        writer = io.open(output_path, 'w', encoding='utf-8')
+
+        def write(page, page_data):
+            writer.write(json.dumps({page: page_data}, ensure_ascii=False))
+            writer.write('\n')
+
+    count = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_convert_worker,
+                             initargs=(exception, ordered, cache_path)) as executor:
+        try:
+            if reader.indexed:
+                func, batches = convert_block, _blocks(reader, to_site, convert, r["pages_skipped"])
+            else:
+                func, batches = convert_batch, _batches(reader, batch_size, to_site, convert, r["pages_skipped"])
+            for results in bounded_map(func, batches, workers, executor=executor):
+                for page, page_to_save, converted in results:
+                    if page_to_save is None:
+                        r["pages_failed"].append(page)
+                        continue
+                    write(page, page_to_save)
+                    r["pages_converted" if converted else "pages_unconverted"].append(page)
+                    count += 1
+                LOG.info("Converted {} pages in {:.2f} sec.".format(count, time.time() - start_time))
+        finally:
+            writer.close()
+
+    r["log_text"] = """
+        Finished converting archive {} to {}.
+        {} pages converted, {} not converted, {} skipped as broken: {}
+        {} pages failed: {}
+        Entire process took {} sec.
+    """.format(input_path, output_path,
+               len(r["pages_converted"]), len(r["pages_unconverted"]),
+               len(r["pages_skipped"]), r["pages_skipped"],
+               len(r["pages_failed"]), r["pages_failed"],
+               time.time() - start_time)
+    LOG.info(r["log_text"])
+    return r
@@ -0,0 +1,69 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import logging
+
+from api.const import KEEP_TITLE
+from convert.sc_to_tc import convert_to_tc, replace_token_by_dict
+
+LOG = logging.getLogger(__name__)
+
+
+def build_page_to_save(page_from, to_site, convert=True, expt={}):
+    """
+    Conversion rules shared by online (copy_one_page) and offline (convert_archive) runs.
+
+    Args:
+        page_from: source page data (pages.get_one)
+        to_site: site to save to
+        convert: True if convert from simplified Chinese to Traditional Chinese
+        expt: conversion exceptions, dict or ExceptionMatcher
+
+    Returns: (page_to_save dict for pages.save_one, True if content was converted)
+
+    """
+    from_page = page_from['fullname']
+    converted = False
+
+    parent_fullname = page_from['parent_fullname']
+    if not parent_fullname:
+        parent_fullname = '-'
+
+    if convert:
+        # handle content
+        from_content = page_from['content']
+        content = convert_to_tc(from_content, except_dict=expt)
+        LOG.debug("content after conversion:\n{}".format(content.encode('utf-8')))
+        converted = True
+        if len(from_content) and from_content == content:
+            LOG.debug("{}: content not converted.".format(from_page))
+            converted = False
+
+        # handle title
+        if from_page.split(":")[0] in KEEP_TITLE and from_page.split(":")[1][0] != "_":
+            title = page_from['title']
+        else:
+            title = convert_to_tc(page_from['title'], except_dict=expt)
+
+        # handle tags
+        tags = convert_to_tc(",".join(page_from['tags']), except_dict=expt).split(",")
+        if '' in tags:
+            tags.remove('')
+        tags.sort()
+
+    else:
+        LOG.info("Not converting.")
+        LOG.debug("Exception dict is {}".format(expt))
+        content = replace_token_by_dict(page_from['content'], expt)
+        title = replace_token_by_dict(page_from['title'], expt)
+        tags = [replace_token_by_dict(t, expt) for t in page_from['tags']]
+
+    page_to_save = {
+        'site': to_site,
+        'page': from_page,
+        'title': title,
+        'content': content,
+        'parent_fullname': parent_fullname,
+        'tags': tags
+    }
+    return page_to_save, converted
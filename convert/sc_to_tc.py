@@ -2,11 +2,44 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
+from convert.matcher import ExceptionMatcher, exception_digest
+from convert.cache import get_cache
+from utility.profiling import stage_timer
+from api.const import CONVERT_SEGMENT_MIN_LINES
 LOG = logging.getLogger(__name__)
 
+OPENCC_CONFIG = 's2twp'
+
+# one warm converter per process. OpenCC loads its dictionaries on init and
+# only reads them afterwards, so a single instance can be shared by threads.
+_converter = None
+_converter_lock = threading.Lock()
+
+
+def get_converter():
+    # lazily build the process-wide OpenCC converter.
+    global _converter
+    if _converter is None:
+        with _converter_lock:
+            if _converter is None:
+                from opencc import OpenCC
+                LOG.debug("Loading OpenCC converter: {}".format(OPENCC_CONFIG))
+                _converter = OpenCC(OPENCC_CONFIG)
+    return _converter
+
+
+def preload_converter():
+    # load dictionaries ahead of time, e.g. when a worker starts.
+    # also usable as a pool initializer.
+    get_converter()
+
 
 def replace_token_by_dict(input_str, exception_dict):
     # given a replace dict with key-value pair of strings, replace value with key.
+    # exception_dict can be a compiled ExceptionMatcher (see compile_exception_dict).
+    if isinstance(exception_dict, ExceptionMatcher):
+        return exception_dict.replace(input_str)
     output_str = input_str
     for k, v in list(exception_dict.items()):
         if k in output_str:
@@ -15,17 +48,64 @@ def replace_token_by_dict(input_str, exception_dict):
     return output_str
 
 
+def _convert_text(text, except_dict):
+    with stage_timer('opencc_convert'):
+        output_str = get_converter().convert(text)
+    with stage_timer('exception_replace'):
+        output_str = replace_token_by_dict(output_str, except_dict)
+    return output_str
+
+
+def _spans_lines(except_dict):
+    # an exception containing a line break can match across lines: convert such pages whole
+    if isinstance(except_dict, ExceptionMatcher):
+        return except_dict.spans_lines
+    return any('\n' in k or '\n' in v for k, v in except_dict.items())
+
+
+def _convert_segments(lines, except_dict, cache, digest):
+    # OpenCC phrases never span a line break, so each line converts on its own.
+    # lines seen before (in this page or cached from earlier runs) are reused;
+    # the new ones are converted together in one call.
+    unique = list(dict.fromkeys(lines))
+    done = cache.get_many(unique, OPENCC_CONFIG, digest) if cache is not None else {}
+    new = [line for line in unique if line not in done]
+    if new:
+        converted = _convert_text('\n'.join(new), except_dict).split('\n')
+        if len(converted) != len(new):
+            converted = [_convert_text(line, except_dict) for line in new]
+        done.update(zip(new, converted))
+        if cache is not None:
+            cache.put_many(list(zip(new, converted)), OPENCC_CONFIG, digest)
+    LOG.debug("Converted {} new of {} lines.".format(len(new), len(lines)))
+    return '\n'.join(done[line] for line in lines)
+
+
 def convert_to_tc(content, except_dict={}):
     # content: unicode.
     # convert an input str to traditional chinese
     content_utf8 = content
-    
-    from opencc import OpenCC
-    cc = OpenCC('s2twp')
-    output_str = cc.convert(content_utf8)
-    
-    output_str = replace_token_by_dict(output_str, except_dict)
 
+    # same text with the same exception dict converts the same: check the cache first
+    cache = get_cache()
+    output_str = None
+    digest = None
+    if cache is not None:
+        digest = exception_digest(except_dict)
+        output_str = cache.get(content_utf8, OPENCC_CONFIG, digest)
+
+    if output_str is None:
+        lines = content_utf8.split('\n')
+        if CONVERT_SEGMENT_MIN_LINES and len(lines) >= CONVERT_SEGMENT_MIN_LINES \
+                and not _spans_lines(except_dict):
+            # long pages: only lines edited since the last conversion cost anything
+            output_str = _convert_segments(lines, except_dict, cache, digest)
+        else:
+            output_str = _convert_text(content_utf8, except_dict)
+        if cache is not None:
+            cache.put(content_utf8, OPENCC_CONFIG, digest, output_str)
+
+    # the large-diff guard below always checks the whole (reassembled) page
     if not len(content):
         LOG.debug("0 content. Bypassing.")
         return content
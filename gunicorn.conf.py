@@ -0,0 +1,15 @@
+# gunicorn settings for the service (app.py): gunicorn --config gunicorn.conf.py app:app
+import os
+
+bind = ':{}'.format(os.getenv('PORT', '8080'))
+# one process keeps jobs, metrics and the rate limiter in one place; threads serve requests
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+threads = int(os.getenv('SERVICE_THREADS', '8'))
+# site jobs run in the background of the worker
+timeout = 0
+
+
+def post_worker_init(worker):
+    # load OpenCC, exceptions and the api client before the first request
+    from app import get_service
+    get_service()
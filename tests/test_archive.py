@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from utility.archive import ArchiveReader, ArchiveWriter, decode_block, index_path, read_index
+
+
+def make_pages(n):
+    return [('song:{}'.format(i), {'title': '歌 {}'.format(i), 'content': 'line\n' * (i % 3)}) for i in range(n)]
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'site.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, pages, **kwargs):
+        w = ArchiveWriter(self.path, **kwargs)
+        for page, data in pages:
+            if page not in w.done_pages:
+                w.write(page, data)
+        return w
+
+    def test_round_trip(self):
+        pages = make_pages(25)
+        self.write(pages, block_pages=10).close()
+
+        reader = ArchiveReader(self.path)
+        self.assertTrue(reader.indexed)
+        self.assertEqual(list(reader), pages)
+        self.assertEqual(reader.pages(), [p for p, _ in pages])
+        self.assertEqual(reader.get('song:13'), pages[13][1])
+        self.assertIsNone(reader.get('song:99'))
+        self.assertEqual([len(b['pages']) for b in read_index(self.path)], [10, 10, 5])
+        # blocks decode on their own, e.g. in a worker process
+        self.assertEqual([p for _, data in reader.iter_blocks() for p in decode_block(data)], pages)
+
+        # the data file stays a plain gzip stream of JSONL
+        with gzip.open(self.path, 'rt', encoding='utf-8') as fh:
+            self.assertEqual([next(iter(json.loads(line))) for line in fh], [p for p, _ in pages])
+
+    def test_plain_jsonl(self):
+        path = os.path.join(self.tmp, 'site.jsonl')
+        pages = make_pages(3)
+        with open(path, 'w', encoding='utf-8') as fh:
+            for page, data in pages:
+                fh.write(json.dumps({page: data}) + '\n')
+        reader = ArchiveReader(path)
+        self.assertFalse(reader.indexed)
+        self.assertEqual(list(reader), pages)
+        self.assertEqual(reader.pages(), [p for p, _ in pages])
+
+    def test_resume_after_kill(self):
+        pages = make_pages(25)
+        w = self.write(pages[:17], block_pages=10)
+        # killed mid-block: a torn block after the last indexed one and a torn index line
+        w.fh.write(gzip.compress(b'{"song:10": ')[:15])
+        w.fh.close()
+        w.index_fh.write('{"offset": ')
+        w.index_fh.close()
+
+        w = ArchiveWriter(self.path, block_pages=10, resume=True)
+        self.assertEqual(w.done_pages, {p for p, _ in pages[:10]})
+        for page, data in pages:
+            if page not in w.done_pages:
+                w.write(page, data)
+        w.close()
+
+        self.assertEqual(list(ArchiveReader(self.path)), pages)
+        self.assertEqual(len(read_index(self.path)), 3)
+
+    def test_resume_without_archive_starts_fresh(self):
+        w = ArchiveWriter(self.path, resume=True)
+        self.assertEqual(w.done_pages, set())
+        w.write('song:1', {})
+        w.close()
+        self.assertTrue(os.path.exists(index_path(self.path)))
+        self.assertEqual(list(ArchiveReader(self.path)), [('song:1', {})])
+
+
+if __name__ == '__main__':
+    unittest.main()
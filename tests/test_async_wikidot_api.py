@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from xmlrpc.client import ProtocolError
+
+from api.async_wikidot_api import AsyncWikidotAPI
+from api.rate_limit import TokenBucket
+from api.retry import RetryPolicy, classify_error, RATE_LIMITED, TRANSIENT, PERMANENT
+from benchmark.fake_server import FakeWikidotServer, generate_pages
+
+
+class AsyncWikidotAPITest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.credential = os.path.join(self.tmp, 'credential.json')
+        with open(self.credential, 'w') as fh:
+            json.dump({'user': 'test', 'ro_key': 'ro', 'rw_key': 'rw'}, fh)
+        self.server = None
+
+    def tearDown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def start(self, **kwargs):
+        self.server = FakeWikidotServer(source_pages=generate_pages(3, 100), **kwargs).start()
+        return self.server
+
+    def call(self, server, method, *params, **kwargs):
+        limiter = kwargs.pop('limiter', None) or TokenBucket(1000, 20)
+
+        async def run():
+            async with AsyncWikidotAPI(self.credential, limiter=limiter,
+                                       api_path=server.url.format(user='test', key='ro'), **kwargs) as api:
+                return await api.call(method, *params)
+        return asyncio.run(run())
+
+    def test_call(self):
+        server = self.start()
+        pages = self.call(server, 'pages.select', {'site': 'horizon-wiki'})
+        self.assertEqual(len(pages), 3)
+
+    def test_429_is_rate_limited_and_retried(self):
+        server = self.start(http_errors=[429])
+        limiter = TokenBucket(1000, 20, min_rate=1)
+        pages = self.call(server, 'pages.select', {'site': 'horizon-wiki'}, limiter=limiter,
+                          retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+        self.assertEqual(len(pages), 3)
+        # penalize() halved the rate, one reward() since
+        self.assertLess(limiter.rate, 1000)
+        self.assertEqual(server.bench_stats()['http.429'], 1)
+
+    def test_5xx_is_transient_and_retried(self):
+        server = self.start(http_errors=[503, 502])
+        pages = self.call(server, 'pages.select', {'site': 'horizon-wiki'},
+                          retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+        self.assertEqual(len(pages), 3)
+
+    def test_http_errors_raise_protocol_error(self):
+        for status, kind in ((429, RATE_LIMITED), (503, TRANSIENT), (404, PERMANENT)):
+            server = self.start(http_errors=[status] * 2)
+            with self.assertRaises(ProtocolError) as ctx:
+                self.call(server, 'pages.select', {'site': 'horizon-wiki'},
+                          retry_policy=RetryPolicy(max_attempts=1))
+            self.assertEqual(ctx.exception.errcode, status)
+            self.assertEqual(classify_error(ctx.exception), kind)
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def test_permanent_error_is_not_retried(self):
+        server = self.start(http_errors=[403, 403])
+        with self.assertRaises(ProtocolError):
+            self.call(server, 'pages.select', {'site': 'horizon-wiki'},
+                      retry_policy=RetryPolicy(max_attempts=3, base_delay=0.01))
+        self.assertEqual(server.bench_stats()['http.403'], 1)
+
+    def test_read_timeout(self):
+        server = self.start(latency=0.5)
+        with self.assertRaises(OSError) as ctx:
+            self.call(server, 'pages.select', {'site': 'horizon-wiki'},
+                      retry_policy=RetryPolicy(max_attempts=1), read_timeout=0.1)
+        self.assertEqual(classify_error(ctx.exception), TRANSIENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from api.budget import RunBudget
+from api.metrics import METRICS
+
+
+class RunBudgetTest(unittest.TestCase):
+
+    def setUp(self):
+        METRICS.reset()
+
+    def run_items(self, budget, items, calls_per_item):
+        taken = []
+        for item in budget.take(items):
+            for _ in range(calls_per_item):
+                METRICS.record_call('pages.get_one', 'site', 0.)
+            taken.append(item)
+            budget.done()
+        return taken
+
+    def test_unbounded(self):
+        budget = RunBudget()
+        self.assertFalse(budget)
+        self.assertEqual(self.run_items(budget, range(50), 3), list(range(50)))
+        self.assertIsNone(budget.stopped)
+
+    def test_max_requests_projects_item_cost(self):
+        # reserve is a tenth of the budget: 90 requests of work, 4 per item
+        budget = RunBudget(max_requests=100, reserve_requests=50)
+        taken = self.run_items(budget, range(50), 4)
+        self.assertEqual(len(taken), 22)
+        self.assertLessEqual(budget.requests(), 90)
+        self.assertEqual(budget.summary()['stopped'], 'max requests 100')
+
+    def test_in_flight_items_count(self):
+        budget = RunBudget(max_requests=100, reserve_requests=0)
+        items = budget.take(range(50))
+        next(items)
+        for _ in range(40):
+            METRICS.record_call('pages.get_one', 'site', 0.)
+        budget.done()
+        # 40 per item: a second one fits, a third would not with the second in flight
+        next(items)
+        self.assertEqual(list(items), [])
+        self.assertEqual(budget.started, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
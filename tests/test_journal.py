@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from utility.journal import CheckpointJournal
+
+
+class CheckpointJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'convert_site.journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_resume_skips_completed(self):
+        j = CheckpointJournal(self.path)
+        j.record('a:1', {'status': 'ok'})
+        j.record('a:2', {'status': 'failed'})
+        j.record('a:2', {'status': 'ok'})
+        j.close()
+
+        j = CheckpointJournal(self.path, resume=True)
+        self.assertTrue(j.is_done('a:1'))
+        self.assertFalse(j.is_done('a:3'))
+        # last line for a key wins
+        self.assertEqual(j.outcome('a:2'), {'status': 'ok'})
+        j.record('a:3', {'status': 'ok'})
+        j.close()
+
+        j = CheckpointJournal(self.path, resume=True)
+        self.assertEqual(set(j.completed), {'a:1', 'a:2', 'a:3'})
+        j.close()
+
+    def test_without_resume_starts_empty(self):
+        j = CheckpointJournal(self.path)
+        j.record('a:1', {})
+        j.close()
+        j = CheckpointJournal(self.path)
+        self.assertFalse(j.is_done('a:1'))
+        j.close()
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_resume_after_complete_starts_over(self):
+        j = CheckpointJournal(self.path)
+        j.record('a:1', {})
+        j.mark_complete()
+        self.assertTrue(j.finished)
+        self.assertFalse(j.is_done(CheckpointJournal.COMPLETE_MARKER))
+        j.close()
+
+        j = CheckpointJournal(self.path, resume=True)
+        self.assertFalse(j.finished)
+        self.assertFalse(j.is_done('a:1'))
+        j.record('a:2', {})
+        j.close()
+
+        # the interrupted new run resumes normally
+        j = CheckpointJournal(self.path, resume=True)
+        self.assertEqual(set(j.completed), {'a:2'})
+        j.close()
+
+    def test_unflushed_records_are_lost_on_kill(self):
+        j = CheckpointJournal(self.path, flush_every=2, flush_sec=3600)
+        j.record('a:1', {})
+        j.record('a:2', {})
+        j.record('a:3', {})
+        # no close(): what a killed run leaves on disk
+        with open(self.path) as fh:
+            self.assertEqual(len(fh.readlines()), 2)
+        j.close()
+
+    def test_torn_line_is_skipped(self):
+        j = CheckpointJournal(self.path)
+        j.record('a:1', {})
+        j.close()
+        with open(self.path, 'a') as fh:
+            fh.write('{"key": "a:2", "outc')
+
+        j = CheckpointJournal(self.path, resume=True)
+        self.assertEqual(set(j.completed), {'a:1'})
+        j.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import random
+import unittest
+
+from convert.matcher import ExceptionMatcher, compile_exception_dict, exception_digest
+from convert.sc_to_tc import replace_token_by_dict
+
+
+def leftmost_longest(text, exception_dict):
+    # reference for the default mode: at each position replace the longest key starting there
+    keys = sorted((k for k in exception_dict if k), key=len, reverse=True)
+    out = []
+    i = 0
+    while i < len(text):
+        for k in keys:
+            if text.startswith(k, i):
+                out.append(exception_dict[k])
+                i += len(k)
+                break
+        else:
+            out.append(text[i])
+            i += 1
+    return ''.join(out)
+
+
+class ExceptionMatcherTest(unittest.TestCase):
+
+    def random_dict(self, rnd, alphabet='abc', values='abcXY'):
+        d = {}
+        for _ in range(rnd.randint(1, 6)):
+            k = ''.join(rnd.choice(alphabet) for _ in range(rnd.randint(1, 3)))
+            d[k] = ''.join(rnd.choice(values) for _ in range(rnd.randint(0, 3)))
+        return d
+
+    def test_ordered_matches_legacy_replace(self):
+        rnd = random.Random(1)
+        for _ in range(2000):
+            d = self.random_dict(rnd)
+            text = ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 20)))
+            matcher = ExceptionMatcher(d, ordered=True)
+            self.assertEqual(matcher.replace(text), replace_token_by_dict(text, d), (d, text))
+
+    def test_default_is_leftmost_longest(self):
+        rnd = random.Random(2)
+        for _ in range(2000):
+            d = self.random_dict(rnd)
+            text = ''.join(rnd.choice('abcd') for _ in range(rnd.randint(0, 20)))
+            self.assertEqual(ExceptionMatcher(d).replace(text), leftmost_longest(text, d), (d, text))
+
+    def test_default_matches_legacy_without_overlaps(self):
+        # keys that cannot overlap or chain give the same result in both modes
+        d = {'软体': '軟體', '内存': '記憶體', '视频': '影片'}
+        text = '软体和内存，视频里的软体。'
+        self.assertEqual(ExceptionMatcher(d).replace(text), replace_token_by_dict(text, d))
+
+    def test_modes_differ_on_chained_keys(self):
+        d = {'ab': 'b', 'bc': 'X'}
+        self.assertEqual(replace_token_by_dict('abc', d), 'X')
+        self.assertEqual(ExceptionMatcher(d, ordered=True).replace('abc'), 'X')
+        self.assertEqual(ExceptionMatcher(d).replace('abc'), 'bc')
+
+    def test_replace_token_by_dict_accepts_matcher(self):
+        matcher = compile_exception_dict({'ab': 'X'})
+        self.assertIs(compile_exception_dict(matcher), matcher)
+        self.assertEqual(replace_token_by_dict('cabab', matcher), 'cXX')
+
+    def test_digest(self):
+        d = {'a': '1', 'b': '2'}
+        self.assertEqual(ExceptionMatcher(d).digest, ExceptionMatcher(dict(d)).digest)
+        self.assertNotEqual(ExceptionMatcher(d).digest, ExceptionMatcher({'a': '1'}).digest)
+        self.assertNotEqual(ExceptionMatcher(d).digest, ExceptionMatcher(d, ordered=True).digest)
+        # key order only matters when applied in order
+        swapped = {'b': '2', 'a': '1'}
+        self.assertEqual(ExceptionMatcher(d).digest, ExceptionMatcher(swapped).digest)
+        self.assertNotEqual(ExceptionMatcher(d, ordered=True).digest, ExceptionMatcher(swapped, ordered=True).digest)
+        # a plain dict is applied key by key
+        self.assertEqual(exception_digest(d), ExceptionMatcher(d, ordered=True).digest)
+
+
+if __name__ == '__main__':
+    unittest.main()
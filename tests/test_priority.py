@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+from datetime import datetime, timezone
+
+from api.priority import prioritize_pages, ParentGate
+from api.scheduler import bounded_map
+
+
+class PrioritizePagesTest(unittest.TestCase):
+
+    def test_parents_first_and_pulled_forward(self):
+        now = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        metas = {
+            'a:old-parent': {'updated_at': '2019-01-01T00:00:00+00:00'},
+            'a:other': {'updated_at': '2023-06-01T00:00:00+00:00'},
+            'a:new-child': {'updated_at': '2023-12-31T00:00:00+00:00', 'parent_fullname': 'a:old-parent'},
+        }
+        ordered, _ = prioritize_pages(list(metas), metas, target_pages=set(metas), category_weights={}, now=now)
+        self.assertEqual(ordered, ['a:old-parent', 'a:new-child', 'a:other'])
+
+    def test_missing_in_target_first(self):
+        metas = {'a:1': {}, 'a:2': {}}
+        ordered, _ = prioritize_pages(['a:1', 'a:2'], metas, target_pages={'a:1'}, category_weights={})
+        self.assertEqual(ordered, ['a:2', 'a:1'])
+
+
+class ParentGateTest(unittest.TestCase):
+
+    def run_gate(self, pages, parents, workers):
+        gate = ParentGate(parents)
+        lock = threading.Lock()
+        started, finished = {}, {}
+
+        def work(p):
+            with lock:
+                started[p] = time.perf_counter()
+            time.sleep(0.01)
+            with lock:
+                finished[p] = time.perf_counter()
+            gate.done(p)
+            return p
+
+        done = list(bounded_map(work, gate.iter(pages), workers))
+        return done, started, finished
+
+    def test_children_start_after_parent_finished(self):
+        # every worker slot could be taken by children of one parent
+        pages = ['p'] + ['c{}'.format(i) for i in range(10)] + ['q', 'd']
+        parents = {'c{}'.format(i): 'p' for i in range(10)}
+        parents['d'] = 'c3'
+        done, started, finished = self.run_gate(pages, parents, workers=2)
+        self.assertEqual(sorted(done), sorted(pages))
+        for child, parent in parents.items():
+            self.assertGreaterEqual(started[child], finished[parent])
+
+    def test_parent_cycle_does_not_hang(self):
+        done, _, _ = self.run_gate(['a', 'b'], {'a': 'b', 'b': 'a'}, workers=2)
+        self.assertEqual(sorted(done), ['a', 'b'])
+
+    def test_single_worker(self):
+        done, _, _ = self.run_gate(['p', 'c', 'x'], {'c': 'p'}, workers=1)
+        self.assertEqual(done, ['p', 'c', 'x'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from api.rate_limit import TokenBucket, shared_limiter
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=50, burst=5)
+        start = time.monotonic()
+        for _ in range(5):
+            self.assertEqual(bucket.try_acquire(), 0.)
+        self.assertGreater(bucket.try_acquire(), 0.)
+        for _ in range(10):
+            bucket.acquire()
+        # 10 tokens past the burst at 50/sec
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_penalize_and_reward(self):
+        bucket = TokenBucket(rate=100, burst=5, min_rate=30)
+        bucket.penalize()
+        self.assertEqual(bucket.rate, 50)
+        # burst allowance is dropped
+        self.assertGreater(bucket.try_acquire(), 0.)
+        bucket.penalize()
+        self.assertEqual(bucket.rate, 30)
+        for _ in range(100):
+            bucket.reward()
+        self.assertEqual(bucket.rate, 100)
+
+    def test_shared_limiter(self):
+        self.assertIs(shared_limiter('test-user'), shared_limiter('test-user'))
+        self.assertIsNot(shared_limiter('test-user'), shared_limiter('other-user'))
+        sharded = shared_limiter('sharded-user', rate=4., burst=8, min_rate=1., shards=4)
+        self.assertEqual((sharded.rate, sharded.burst, sharded.min_rate), (1., 2., .25))
+
+
+if __name__ == '__main__':
+    unittest.main()
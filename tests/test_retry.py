@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import http.client
+import socket
+import unittest
+from xmlrpc.client import Fault, ProtocolError
+
+from api.retry import RetryPolicy, classify_error, RATE_LIMITED, TRANSIENT, PERMANENT
+
+
+class ClassifyErrorTest(unittest.TestCase):
+
+    def test_faults(self):
+        self.assertEqual(classify_error(Fault(429, 'slow down')), RATE_LIMITED)
+        self.assertEqual(classify_error(Fault(406, 'Rate limit exceeded')), RATE_LIMITED)
+        self.assertEqual(classify_error(Fault(406, 'Too many requests, try again later')), RATE_LIMITED)
+        self.assertEqual(classify_error(Fault(500, 'internal error')), TRANSIENT)
+        self.assertEqual(classify_error(Fault(503, 'unavailable')), TRANSIENT)
+        self.assertEqual(classify_error(Fault(404, 'page does not exist')), PERMANENT)
+        self.assertEqual(classify_error(Fault(406, 'not allowed')), PERMANENT)
+        # wikidot sometimes sends a non-numeric fault code
+        self.assertEqual(classify_error(Fault('Client', 'bad request')), PERMANENT)
+
+    def test_protocol_errors(self):
+        def error(code):
+            return ProtocolError('www.wikidot.com/xml-rpc-api.php', code, 'reason', {})
+        self.assertEqual(classify_error(error(429)), RATE_LIMITED)
+        self.assertEqual(classify_error(error(502)), TRANSIENT)
+        self.assertEqual(classify_error(error(401)), PERMANENT)
+
+    def test_connection_errors(self):
+        for e in (ConnectionResetError(), socket.timeout(), http.client.RemoteDisconnected(), OSError()):
+            self.assertEqual(classify_error(e), TRANSIENT, e)
+
+    def test_other_errors(self):
+        self.assertEqual(classify_error(ValueError('bad value')), PERMANENT)
+        self.assertEqual(classify_error(KeyError('content')), PERMANENT)
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+        self.assertTrue(policy.should_retry(RATE_LIMITED, 1))
+        self.assertTrue(policy.should_retry(TRANSIENT, 2))
+        self.assertFalse(policy.should_retry(TRANSIENT, 3))
+        self.assertFalse(policy.should_retry(PERMANENT, 1))
+
+    def test_delay_is_capped(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        for attempt in range(1, 10):
+            self.assertTrue(0 <= policy.delay(attempt) <= min(5, 2 ** attempt))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from api.sync_state import SyncState
+
+
+class SyncStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'sync_state.sqlite')
+        self.state = SyncState('from', 'to', path=self.path)
+        self.meta_from = {'revisions': 3, 'updated_at': '2024-01-01T00:00:00+00:00'}
+        self.meta_to = {'revisions': 1, 'updated_at': '2024-01-02T00:00:00+00:00'}
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.tmp)
+
+    def test_needs_sync(self):
+        s = self.state
+        self.assertEqual(s.needs_sync('a:1', self.meta_from, self.meta_to), 'new')
+        s.record('a:1', self.meta_from, self.meta_to, 'hash', 'target-hash', exception_digest='d1')
+
+        self.assertIsNone(s.needs_sync('a:1', self.meta_from, self.meta_to, digest='d1'))
+        # no digest given: exception changes are not checked
+        self.assertIsNone(s.needs_sync('a:1', self.meta_from, self.meta_to))
+        self.assertEqual(s.needs_sync('a:1', self.meta_from, None), 'missing in target')
+        self.assertEqual(s.needs_sync('a:1', dict(self.meta_from, revisions=4), self.meta_to), 'source changed')
+        self.assertEqual(s.needs_sync('a:1', dict(self.meta_from, updated_at='2024-02-01T00:00:00+00:00'),
+                                      self.meta_to), 'source changed')
+        self.assertEqual(s.needs_sync('a:1', self.meta_from, dict(self.meta_to, revisions=2)), 'target drifted')
+        self.assertEqual(s.needs_sync('a:1', self.meta_from, self.meta_to, digest='d2'), 'exceptions changed')
+
+    def test_unconfirmed_save(self):
+        self.state.record('a:1', self.meta_from, self.meta_to, 'hash', None)
+        self.assertEqual(self.state.needs_sync('a:1', self.meta_from, self.meta_to), 'target unverified')
+
+    def test_state_is_per_site_pair(self):
+        self.state.record('a:1', self.meta_from, self.meta_to, 'hash', 'target-hash')
+        self.state.commit()
+        other = SyncState('from', 'other', path=self.path)
+        self.assertEqual(other.needs_sync('a:1', self.meta_from, self.meta_to), 'new')
+        other.close()
+
+    def test_all_and_reopen(self):
+        self.state.record('a:1', self.meta_from, self.meta_to, 'hash', 'target-hash', exception_digest='d1')
+        self.state.record('a:2', self.meta_from, None, 'hash', 'target-hash')
+        self.state.commit()
+        reopened = SyncState('from', 'to', path=self.path)
+        states = reopened.all()
+        reopened.close()
+        self.assertEqual(set(states), {'a:1', 'a:2'})
+        self.assertEqual(states['a:1']['exception_digest'], 'd1')
+        self.assertIsNone(self.state.needs_sync('a:1', self.meta_from, self.meta_to, state=states['a:1'],
+                                                digest='d1'))
+
+    def test_migrates_state_without_exception_digest(self):
+        path = os.path.join(self.tmp, 'old.sqlite')
+        conn = sqlite3.connect(path)
+        conn.execute(SyncState.SCHEMA.replace('        exception_digest TEXT,\n', ''))
+        conn.execute('INSERT INTO page_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                     ('from', 'to', 'a:1', 3, self.meta_from['updated_at'], 1, self.meta_to['updated_at'],
+                      'hash', 'target-hash', 0))
+        conn.commit()
+        conn.close()
+
+        state = SyncState('from', 'to', path=path)
+        self.assertIsNone(state.get('a:1')['exception_digest'])
+        self.assertIsNone(state.needs_sync('a:1', self.meta_from, self.meta_to))
+        # converted with an unknown dict: reconverted once a digest is known
+        self.assertEqual(state.needs_sync('a:1', self.meta_from, self.meta_to, digest='d1'), 'exceptions changed')
+        state.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import gzip
+import io
+import json
+import logging
+import os
+
+from api.const import ARCHIVE_BLOCK_PAGES
+
+LOG = logging.getLogger(__name__)
+
+"""
+Block-compressed site archive.
+
+Data file (e.g. site_2024-01-01.jsonl.gz): concatenated gzip members, each holding
+up to ARCHIVE_BLOCK_PAGES JSONL lines of {page name: page data}. The whole file is
+a valid gzip stream, so `zcat` / gzip.open read it as plain JSONL.
+
+Index file (<data file>.idx): one JSON line per block, written after the block:
+{"offset": byte offset, "length": compressed bytes, "pages": [page names in order]}
+
+Plain .jsonl archives written before this format are still readable (no index).
+"""
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def read_index(path):
+    # list of block entries; a torn last line of a killed run is ignored
+    blocks = []
+    if not os.path.exists(index_path(path)):
+        return blocks
+    with io.open(index_path(path), 'r', encoding='utf-8') as fh:
+        for line in fh:
+            try:
+                blocks.append(json.loads(line))
+            except ValueError:
+                LOG.warning("Skipping malformed index line: {}".format(line.strip()))
+                break
+    return blocks
+
+
+def decode_block(data):
+    # (page name, page data) pairs of one compressed block, in order
+    pages = []
+    for line in gzip.decompress(data).decode('utf-8').splitlines():
+        if line.strip():
+            pages.extend(json.loads(line).items())
+    return pages
+
+
+class ArchiveWriter(object):
+    """
+    Streams pages into a block-compressed archive. With resume, pages of
+    complete blocks are kept (see done_pages) and anything after the last
+    indexed block is truncated before appending.
+    """
+
+    def __init__(self, path, block_pages=ARCHIVE_BLOCK_PAGES, resume=False):
+        self.path = path
+        self.block_pages = block_pages
+        self.buffer = []
+        self.buffer_pages = []
+        self.done_pages = set()
+        self.count = 0
+
+        blocks = read_index(path) if resume and os.path.exists(path) else []
+        if blocks:
+            end = blocks[-1]['offset'] + blocks[-1]['length']
+            for b in blocks:
+                self.done_pages.update(b['pages'])
+            LOG.info("Resuming archive {}: {} pages in {} blocks.".format(path, len(self.done_pages), len(blocks)))
+            self.fh = io.open(path, 'r+b')
+            self.fh.truncate(end)
+            self.fh.seek(end)
+            self.index_fh = io.open(index_path(path), 'w', encoding='utf-8')
+            for b in blocks:
+                self._write_index(b)
+        else:
+            self.fh = io.open(path, 'wb')
+            self.index_fh = io.open(index_path(path), 'w', encoding='utf-8')
+
+    def _write_index(self, block):
+        self.index_fh.write(json.dumps(block, ensure_ascii=False))
+        self.index_fh.write('\n')
+        self.index_fh.flush()
+
+    def write(self, page, page_data):
+        self.buffer.append(json.dumps({page: page_data}, ensure_ascii=False))
+        self.buffer_pages.append(page)
+        self.count += 1
+        if len(self.buffer) >= self.block_pages:
+            self.flush_block()
+
+    def flush_block(self):
+        if not self.buffer:
+            return
+        data = gzip.compress(('\n'.join(self.buffer) + '\n').encode('utf-8'))
+        offset = self.fh.tell()
+        self.fh.write(data)
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        # index only after the block is on disk, so it never points past the data
+        self._write_index({'offset': offset, 'length': len(data), 'pages': self.buffer_pages})
+        self.done_pages.update(self.buffer_pages)
+        self.buffer = []
+        self.buffer_pages = []
+
+    def close(self):
+        self.flush_block()
+        self.fh.close()
+        self.index_fh.close()
+
+
+class ArchiveReader(object):
+    """
+    Reads archives written by ArchiveWriter, or plain JSONL archives.
+    Iteration streams (page name, page data) in archive order; get() uses the index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compressed = path.endswith('.gz')
+        self._page_block = None
+
+    @property
+    def indexed(self):
+        return self.compressed and os.path.exists(index_path(self.path))
+
+    def __iter__(self):
+        opener = gzip.open if self.compressed else io.open
+        with opener(self.path, 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                if not line.strip():
+                    continue
+                for page, page_data in json.loads(line).items():
+                    yield page, page_data
+
+    def iter_blocks(self):
+        # raw blocks: (page names, compressed bytes), for decode_block in worker processes
+        with io.open(self.path, 'rb') as fh:
+            for b in read_index(self.path):
+                fh.seek(b['offset'])
+                yield b['pages'], fh.read(b['length'])
+
+    def pages(self):
+        if self.indexed:
+            return [p for b in read_index(self.path) for p in b['pages']]
+        return [p for p, _ in self]
+
+    def get(self, page):
+        # random access to one page through the index
+        if self._page_block is None:
+            self._page_block = {}
+            for b in read_index(self.path):
+                for i, p in enumerate(b['pages']):
+                    self._page_block[p] = (b['offset'], b['length'], i)
+        if page not in self._page_block:
+            return None
+        offset, length, i = self._page_block[page]
+        with io.open(self.path, 'rb') as fh:
+            fh.seek(offset)
+            return decode_block(fh.read(length))[i][1]
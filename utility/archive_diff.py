@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import time
+
+from api.const import SKIP_FILE_COPY
+from api.slack import notify_status
+from utility.archive import ArchiveReader
+
+LOG = logging.getLogger(__name__)
+
+# page fields compared between archives, in index tuple order
+DIFF_FIELDS = ['content', 'title', 'tags', 'parent_fullname', 'files']
+
+
+def _h(value):
+    # 8-byte digest keeps the index small: ~100 bytes per page incl. name
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')
+    return hashlib.blake2b(payload, digest_size=8).digest()
+
+
+def page_digest(page_data):
+    """
+    Hashes of the compared fields of one archived page.
+    File names come from the '_files' key written by archive_site --with_files.
+
+    Returns: (tuple of field hashes in DIFF_FIELDS order, tuple of file names)
+    """
+    files = tuple(sorted(page_data.get('_files') or []))
+    tags = sorted(page_data.get('tags') or [])
+    parent = page_data.get('parent_fullname') or '-'
+    hashes = (_h(page_data.get('content')), _h(page_data.get('title')), _h(tags), _h(parent), _h(files))
+    return hashes, files
+
+
+@notify_status('Compare Archives')
+def diff_archives(from_path, to_path, fields=None):
+    """
+    Offline counterpart of WikidotAPI.compare_sites over two archives.
+
+    The to_path archive is indexed (page name -> field hashes, file names) and the
+    from_path archive is streamed against it, so memory is one small record per page.
+
+    Args:
+        from_path: archive of the source site
+        to_path: archive of the target site
+        fields: DIFF_FIELDS to report as changed; all by default. Use a subset
+            (e.g. ['parent_fullname', 'files']) when the sites differ by conversion.
+
+    Returns: removed/added/changed pages and files report, same keys and types as compare_sites,
+        plus changed_page_fields: changed page -> names of its changed fields
+    """
+    fields = fields or DIFF_FIELDS
+    field_idx = [DIFF_FIELDS.index(f) for f in fields]
+    start_time = time.time()
+
+    index = {}
+    for page, page_data in ArchiveReader(to_path):
+        index[page] = page_digest(page_data)
+    LOG.info("Indexed {} pages of {} in {:.2f} sec.".format(len(index), to_path, time.time() - start_time))
+
+    r = {
+        "removed_pages": [],
+        "added_pages": [],
+        "changed_pages": [],
+        "changed_page_fields": {},
+        "removed_files": [],
+        "added_files": [],
+        "skipped_pages": [],
+        "log_text_lines": []
+    }
+
+    seen = set()
+    from_count = 0
+    from_file_count = 0
+    for page, page_data in ArchiveReader(from_path):
+        from_count += 1
+        seen.add(page)
+        hashes, files = page_digest(page_data)
+        from_file_count += len(files)
+        to_entry = index.get(page)
+        if to_entry is None:
+            r["added_pages"].append(page)
+            to_hashes, to_files = None, ()
+        else:
+            to_hashes, to_files = to_entry
+            changed = [DIFF_FIELDS[i] for i in field_idx if hashes[i] != to_hashes[i]]
+            if changed:
+                r["changed_pages"].append(page)
+                r["changed_page_fields"][page] = changed
+
+        if page.split(':')[0] in SKIP_FILE_COPY:
+            r["skipped_pages"].append(page)
+        elif to_hashes is None or hashes[4] != to_hashes[4]:
+            from_set, to_set = set(files), set(to_files)
+            r["removed_files"].extend(u'{}/{}'.format(page, f) for f in to_files if f not in from_set)
+            r["added_files"].extend(u'{}/{}'.format(page, f) for f in files if f not in to_set)
+
+    r["removed_pages"] = [p for p in index if p not in seen]
+
+    lt = """
+        {} pages in {},
+        {} pages in {},
+        {} added pages: {},
+        {} removed pages: {},
+        {} changed pages: {},
+        {} files in {},
+        {} added files: {},
+        {} removed files: {},
+        Took {:.2f} sec.
+        """.format(from_count, from_path, len(index), to_path,
+                   len(r["added_pages"]), r["added_pages"],
+                   len(r["removed_pages"]), r["removed_pages"],
+                   len(r["changed_pages"]), r["changed_page_fields"],
+                   from_file_count, from_path,
+                   len(r["added_files"]), r["added_files"],
+                   len(r["removed_files"]), r["removed_files"],
+                   time.time() - start_time)
+    LOG.info(lt)
+    r["log_text_lines"].append(lt)
+    return r
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+
+from api.const import JOURNAL_FLUSH_EVERY, JOURNAL_FLUSH_SEC
+
+LOG = logging.getLogger(__name__)
+
+
+class CheckpointJournal(object):
+    """
+    Append-only JSONL journal of completed work items and their outcome.
+
+    Each line is {"key": ..., "outcome": {...}, "ts": ...}; the last line for a
+    key wins. Writes are buffered and flushed every JOURNAL_FLUSH_EVERY records
+    or JOURNAL_FLUSH_SEC seconds, so a killed job loses at most that much work.
+    Without resume the journal starts empty; with resume completed keys are
+    loaded and can be skipped. A run that got through all its work calls
+    mark_complete(), so resuming after it starts a new, empty journal instead
+    of skipping everything.
+    """
+
+    COMPLETE_MARKER = '__complete__'
+
+    def __init__(self, path, resume=False, flush_every=JOURNAL_FLUSH_EVERY, flush_sec=JOURNAL_FLUSH_SEC):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_sec = flush_sec
+        self.completed = {}
+        self.finished = False
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            self._load()
+            if self.finished:
+                LOG.info("Journal {} is of a finished run, starting a new one.".format(path))
+                self.completed = {}
+                self.finished = False
+                resume = False
+            else:
+                LOG.info("Resuming from journal {}: {} completed entries.".format(path, len(self.completed)))
+
+        self.fh = io.open(path, 'a' if resume else 'w', encoding='utf-8')
+        self.unflushed = 0
+        self.last_flush = time.time()
+
+    def _load(self):
+        with io.open(self.path, 'r', encoding='utf-8') as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # torn last line of a killed run
+                    LOG.warning("Skipping malformed journal line: {}".format(line.strip()))
+                    continue
+                if entry['key'] == self.COMPLETE_MARKER:
+                    self.finished = True
+                    continue
+                self.completed[entry['key']] = entry['outcome']
+
+    def is_done(self, key):
+        return key in self.completed
+
+    def outcome(self, key):
+        return self.completed.get(key)
+
+    def record(self, key, outcome):
+        line = json.dumps({'key': key, 'outcome': outcome, 'ts': time.time()}, ensure_ascii=False)
+        with self.lock:
+            self.completed[key] = outcome
+            self.fh.write(line)
+            self.fh.write('\n')
+            self.unflushed += 1
+            if self.unflushed >= self.flush_every or time.time() - self.last_flush >= self.flush_sec:
+                self._flush()
+
+    def mark_complete(self):
+        # the run went through all its items; the next resume starts over
+        self.record(self.COMPLETE_MARKER, {})
+        with self.lock:
+            self.completed.pop(self.COMPLETE_MARKER, None)
+            self.finished = True
+            self._flush()
+
+    def _flush(self):
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+        self.unflushed = 0
+        self.last_flush = time.time()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            if not self.fh.closed:
+                self._flush()
+                self.fh.close()
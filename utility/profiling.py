@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from api.metrics import METRICS
+
+LOG = logging.getLogger(__name__)
+
+PROFILE_MODES = ('deterministic', 'sampling')
+
+
+@contextmanager
+def stage_timer(stage):
+    # adds the wall time of the block to the named stage in METRICS (see ApiMetrics.record_stage)
+    ts = time.perf_counter()
+    try:
+        yield
+    finally:
+        METRICS.record_stage(stage, time.perf_counter() - ts)
+
+
+class Profiler(object):
+    """
+    Profile a whole action, including the worker threads it starts.
+
+    deterministic: cProfile in every thread, merged into one pstats file (<path>.pstats).
+                   Inspect with `python -m pstats` or snakeviz.
+    sampling: a background thread samples the stacks of all threads every `interval`
+              seconds and writes collapsed stacks (<path>.collapsed), one
+              "frame;frame;frame count" line per distinct stack, for flamegraph.pl / speedscope.
+              Much lower overhead on long runs.
+
+    Worker processes (convert_archive) are not profiled.
+    """
+
+    def __init__(self, path, mode='deterministic', interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError("Unknown profile mode: {}. Use one of {}".format(mode, PROFILE_MODES))
+        self.path = path
+        self.mode = mode
+        self.interval = interval
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.samples = Counter()
+        self.stop_event = threading.Event()
+        self.sampler = None
+        self.start_time = None
+
+    def start(self):
+        self.start_time = time.time()
+        if self.mode == 'deterministic':
+            # threads started from now on install their own profiler on their first event
+            threading.setprofile(self._start_thread_profile)
+            self._new_profile().enable()
+        else:
+            self.sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+            self.sampler.start()
+        LOG.info("Profiling ({}) to {}".format(self.mode, self.output_path()))
+
+    def _new_profile(self):
+        prof = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(prof)
+        return prof
+
+    def _start_thread_profile(self, frame, event, arg):
+        # replaces itself with a cProfile profiler for the rest of this thread
+        self._new_profile().enable()
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def output_path(self):
+        return '{}.{}'.format(self.path, 'pstats' if self.mode == 'deterministic' else 'collapsed')
+
+    def stop(self, top=30):
+        path = self.output_path()
+        if self.mode == 'deterministic':
+            threading.setprofile(None)
+            stats = None
+            with self.lock:
+                for prof in self.profiles:
+                    prof.disable()
+                    if stats is None:
+                        stats = pstats.Stats(prof)
+                    else:
+                        stats.add(prof)
+            stats.dump_stats(path)
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats('cumulative').print_stats(top)
+            LOG.info("Profile top {} by cumulative time:\n{}".format(top, out.getvalue()))
+        else:
+            self.stop_event.set()
+            self.sampler.join()
+            with io.open(path, 'w', encoding='utf-8') as fh:
+                for stack, n in self.samples.most_common():
+                    fh.write('{} {}\n'.format(stack, n))
+            LOG.info("{} stack samples in {:.1f} sec".format(sum(self.samples.values()), time.time() - self.start_time))
+        LOG.info("Wrote profile to {}".format(path))
+        return path
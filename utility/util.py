@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 
 import re
+import json
+import zlib
+import base64
+import hashlib
 import logging
 import zipfile
 from api.const import CONST_IMG_URL_PATTERN
@@ -28,6 +32,24 @@ def unique_content_list(l):
     return list(new_list.values())
 
 
+def iter_b64decode(content, chunk_chars=1 << 16):
+    """
+    Decode base64 text piece by piece, yielding bytes, so the decoded file is never held in memory whole.
+
+    :param content: base64 text (whitespace allowed)
+    :param chunk_chars: characters decoded at a time
+    """
+    rest = ''
+    for i in range(0, len(content), chunk_chars):
+        part = rest + ''.join(content[i:i + chunk_chars].split())
+        cut = len(part) - len(part) % 4
+        rest = part[cut:]
+        if cut:
+            yield base64.b64decode(part[:cut])
+    if rest:
+        raise ValueError("Truncated base64 content")
+
+
 def url_is_image(url):
     """
     return true if the url is an wikidot image url
@@ -79,6 +101,104 @@ def compare_dict_values(from_dict, to_dict, keys=None, keep_list_order=False):
     return True
 
 
+def content_hash(*values):
+    """
+    Stable short hash of page values (str, list of tags, ...).
+
+    :param values: json serializable values
+    :return: hex digest
+    """
+    payload = json.dumps(values, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def parse_shard(shard):
+    """
+    Parse a shard spec "i/N" (0 <= i < N).
+
+    :param shard: shard spec string, or None
+    :return: (i, N) tuple, or None
+    """
+    if not shard:
+        return None
+    i, n = [int(x) for x in shard.split('/')]
+    if n < 1 or not 0 <= i < n:
+        raise ValueError("Invalid shard {}: expected i/N with 0 <= i < N".format(shard))
+    return i, n
+
+
+def in_shard(name, shard):
+    """
+    Whether a page belongs to a shard. Stable across runs, machines and python versions.
+
+    :param name: page name
+    :param shard: (i, N) tuple from parse_shard, or None for no sharding
+    """
+    if not shard:
+        return True
+    return zlib.crc32(name.encode('utf-8')) % shard[1] == shard[0]
+
+
+# per-shard values that do not add up across shards (shards run side by side): keep the largest
+MERGE_MAX_KEYS = ('elapsed_sec', 'max_sec', 'p50_sec', 'p95_sec', 'utilization', 'max_runtime', 'max_requests')
+
+
+def merge_nested_dicts(merged, d):
+    """
+    Merge a dict-valued report field (api_metrics, budget, pipeline_stats, ...) of one shard into merged.
+    Numbers are summed, except MERGE_MAX_KEYS which keep the largest; lists are concatenated;
+    dicts are merged recursively; other values keep the first non-empty one.
+    Averages (avg_sec) are recomputed from total_sec / count.
+
+    :param merged: dict merged so far, updated in place
+    :param d: dict of one shard
+    :return: merged
+    """
+    for k, v in d.items():
+        if k not in merged:
+            merged[k] = merge_nested_dicts({}, v) if isinstance(v, dict) else (list(v) if isinstance(v, list) else v)
+        elif isinstance(v, dict) and isinstance(merged[k], dict):
+            merge_nested_dicts(merged[k], v)
+        elif isinstance(v, list) and isinstance(merged[k], list):
+            merged[k] += v
+        elif isinstance(v, (int, float)) and not isinstance(v, bool) \
+                and isinstance(merged[k], (int, float)) and not isinstance(merged[k], bool):
+            merged[k] = max(merged[k], v) if k in MERGE_MAX_KEYS else merged[k] + v
+        elif not merged[k]:
+            merged[k] = v
+    if 'avg_sec' in merged and merged.get('count'):
+        merged['avg_sec'] = round(merged.get('total_sec', 0) / merged['count'], 4)
+    return merged
+
+
+def merge_result_dicts(results):
+    """
+    Combine result dicts of the same job run on several shards.
+    Lists are concatenated, numbers summed, log texts joined, dicts (api_metrics, budget, ...)
+    merged with merge_nested_dicts; other values keep the last one.
+
+    :param results: list of result dicts
+    :return: merged result dict
+    """
+    merged = {}
+    for result in results:
+        for k, v in result.items():
+            if k == 'log_text':
+                merged.setdefault('log_text_lines', []).append(v)
+            elif k == 'err':
+                merged[k] = merged.get(k, '') + v
+            elif isinstance(v, list):
+                merged.setdefault(k, [])
+                merged[k] += v
+            elif isinstance(v, dict):
+                merge_nested_dicts(merged.setdefault(k, {}), v)
+            elif isinstance(v, (int, float)) and not isinstance(v, bool):
+                merged[k] = merged.get(k, 0) + v
+            else:
+                merged[k] = v
+    return merged
+
+
 def zip_file(input_file, output_file):
     with zipfile.ZipFile(output_file, 'w', zipfile.ZIP_DEFLATED) as zip_file_out:
         zip_file_out.write(input_file)
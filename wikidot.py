@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import urllib.request, urllib.parse, urllib.error
 import json
 import os
 import argparse
@@ -10,15 +9,32 @@ import logging
 import time
 import sys
 import pprint
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
 from xmlrpc.client import Fault
 
-from utility.util import compare_dict_values, zip_file
-from convert.sc_to_tc import convert_to_tc, replace_token_by_dict
+from utility.util import compare_dict_values, zip_file, content_hash, parse_shard, merge_result_dicts
+from convert.sc_to_tc import convert_to_tc, preload_converter
+from convert.matcher import compile_exception_dict
+from convert.cache import enable_cache, get_cache
+from convert.page import build_page_to_save
+from convert.offline import convert_archive, init_convert_worker, convert_batch
 from api.wikidot_api import WikidotAPI
-from api.slack import notify_status
-from api.const import KEEP_FILE, KEEP_TITLE, SKIP_FILE_COPY, CONTENT_BROKEN_PAGES, CONST_FILE_PREFIX, \
-    FROM_SITE, TO_SITE, PATH_CONVERT_EXCEPTION, LOGGING_FORMAT
+from api.sync_state import SyncState
+from api.pipeline import Pipeline, Stage
+from api.retry import classify_error, PERMANENT
+from api.priority import prioritize_pages, ParentGate
+from api.page_index import PageNames
+from api.budget import RunBudget
+from api.metrics import METRICS
+from utility.journal import CheckpointJournal
+from utility.profiling import Profiler, PROFILE_MODES, stage_timer
+from utility.archive_diff import diff_archives
+from api.slack import notify_status, SlackWebHook
+from api.const import KEEP_FILE, SKIP_FILE_COPY, CONTENT_BROKEN_PAGES, \
+    FROM_SITE, TO_SITE, PATH_CONVERT_EXCEPTION, PATH_SYNC_STATE, PATH_CONVERT_CACHE, LOGGING_FORMAT, \
+    API_MAX_WORKERS, PATH_JOURNAL_TEMPLATE, PATH_FILE_INVENTORY, CATEGORY_WEIGHTS
 
 __author__ = 'eve'
 
@@ -43,6 +59,25 @@ python wikidot.py convert_site --category <category_name> [<category_name> <cate
 Update all pages:
 python wikidot.py convert_site [--debug]
 
+Update pages changed since the last sync:
+python wikidot.py convert_site --incremental [--state sync_state.sqlite]
+
+Keep a checkpoint journal, and resume an interrupted convert_site / copy_files run from it:
+python wikidot.py convert_site --resume [--journal convert_site.journal.jsonl]
+
+Run one shard of a site job and combine the shard reports:
+python wikidot.py convert_site --shard 0/4 --report report-0.json
+python wikidot.py merge_reports --reports report-0.json report-1.json report-2.json report-3.json
+
+Archive a site (resume an interrupted archive with --resume --output <file>):
+python wikidot.py archive_site --site <site_name> [--output <file>.jsonl.gz] [--resume]
+
+Convert an archive offline (no API calls):
+python wikidot.py convert_archive --input <site>.jsonl.gz --output <site>-tc.jsonl.gz [--processes 4]
+
+Compare two archives offline (archive with --with_files to compare file lists):
+python wikidot.py diff_archives --archives <from>.jsonl.gz <to>.jsonl.gz [--fields parent_fullname files]
+
 Copy file for one page:
 python wikidot.py copy_files --page <page_name>
 
@@ -52,6 +87,9 @@ python wikidot.py copy_files --category <category_name> [<category_name> <catego
 Copy file for all site:
 python wikidot.py copy_files
 
+Save all files of a site to a local store (optionally upload them to another site):
+python wikidot.py save_files --site <site_name> --category <category_name> --output <dir> [--upload_site <site_name>]
+
 """
 
 LOG = logging.getLogger()
@@ -60,104 +98,47 @@ LOG = logging.getLogger()
 # retrieve archived files
 def save_archive_files(s, site, categories, local_dir, upload_site=None):
     # categories: list
-
-    # pages = s.pages.select({'site': site, 'categories': categories})
-    pages = s.get_pages(site=site, categories=categories)
-    os.chdir(local_dir)
-    for page_name in pages:
-        img_name = s.files.select({'site': site, 'page': page_name})[0]
-        img_url = '{}/{}/{}'.format(CONST_FILE_PREFIX, page_name, img_name)
-        local_name = '{}.{}'.format(page_name, img_name)
-        local_name = local_name.replace(":", "_")
-        LOG.info('Getting "{}" to "{}/{}"'.format(img_url, local_dir, local_name))
-        urllib.request.urlretrieve(img_url, local_name)
+    # all files of the pages (not only the first), deduplicated by content under local_dir/blobs
+    return s.mirror_files(site, local_dir, categories=categories, upload_site=upload_site)
 
 # opencc -i test.in -o test.out -c s2twp.json
 
 
-@notify_status(job_name='Copy one page')
-def copy_one_page(s, from_site, to_site, from_page, convert=True, expt={}):
-    """
-
-    Args:
-        s: authorized WikidotAPI instance
-        from_site: site to copy from
-        to_site: site to copy to
-        from_page: page name to copy from
-        convert: True if convert from simplified Chinese to Traditional Chinese
-        expt:
-
-    Returns: dictionary of option report
-
-    """
-    res = {
-        "converted": False,
-        "saved": False,
-        "log_text_lines": []
-    }
-
-    # if for some pages we know the content is broken/incomplete,
-    # skip automation and do it manually.
-    if from_page in CONTENT_BROKEN_PAGES:
-        lt = "{}: Known page with incomplete content. Not copying.".format(from_page)
+def get_target_page(s, to_site, from_page, res, target_exists=None):
+    # existing page in to_site, None if it does not exist
+    page_to = None
+    if target_exists is not False:
+        try:
+            page_to = s.get_single_page(to_site, from_page)
+            LOG.debug("Page existing:\n{}".format(page_to))
+        except Fault:
+            pass
+    if page_to is None:
+        lt = "{}: does not exists in {}.  Proceed with saving.".format(from_page, to_site)
         LOG.info(lt)
         res["log_text_lines"].append(lt)
-        return res
+    return page_to
 
-    page_from = s.get_single_page(from_site, from_page)
-    parent_fullname = page_from['parent_fullname']
-    if not parent_fullname:
-        parent_fullname = '-'
-
-    if convert:
-        # handle content
-        from_content = page_from['content']
-        content = convert_to_tc(from_content, except_dict=expt)
-        LOG.debug("content after conversion:\n{}".format(content.encode('utf-8')))
-        res["converted"] = True
-        if len(from_content) and from_content == content:
-            LOG.debug("{}: content not converted.".format(from_page))
-            res["converted"] = False
-
-        # handle title
-        if from_page.split(":")[0] in KEEP_TITLE and from_page.split(":")[1][0] != "_":
-            title = page_from['title']
-        else:
-            title = convert_to_tc(page_from['title'], except_dict=expt)
 
-        # handle tags
-        tags = convert_to_tc(",".join(page_from['tags']), except_dict=expt).split(",")
-        if '' in tags:
-            tags.remove('')
-        tags.sort()
+def record_page_hashes(res, page_from, page_to_save):
+    # hashes for incremental sync state; only once the target holds page_to_save (saved or unchanged).
+    # tags are missing when the page was saved without them (see save_page_if_changed)
+    res["content_hash"] = content_hash(page_from['content'], page_from['title'], page_from['tags'])
+    res["target_hash"] = content_hash(page_to_save['content'], page_to_save['title'], page_to_save.get('tags'))
 
-    else:
-        LOG.info("Not converting.")
-        LOG.debug("Exception dict is {}".format(expt))
-        content = replace_token_by_dict(page_from['content'], expt)
-        title = replace_token_by_dict(page_from['title'], expt)
-        tags = replace_token_by_dict(page_from['tags'], expt)
-
-    page_to_save = {
-        'site': to_site,
-        'page': page_from['fullname'],
-        'title': title,
-        'content': content,
-        'parent_fullname': parent_fullname,
-        'tags': tags
-    }
-    LOG.debug("Page to save:\n{}".format(page_to_save))
 
-    # if nothing is going to change, do not do the save.
-    page_to = None
-    try:
-        page_to = s.get_single_page(to_site, from_page)
-        LOG.debug("Page existing:\n{}".format(page_to))
-    except Fault:
-        lt = "{}: does not exists in {}.  Proceed with saving.".format(from_page, to_site)
-        LOG.info(lt)
-        res["log_text_lines"].append(lt)
+def save_page_if_changed(s, from_page, page_to_save, page_to, res):
+    """
+    Save page_to_save unless page_to already has the same content, title, tags and parent.
+    If the save fails, retry once without tags.
+
+    Returns: res with "saved" set, and "failed" set if the page could not be saved
+    """
+    content = page_to_save['content']
+    title = page_to_save['title']
+    tags = page_to_save['tags']
 
+    # if nothing is going to change, do not do the save.
     if page_to and content == page_to['content'] and title == page_to['title'] and tags == page_to['tags']:
         lt = "{}: same content as original site, not saving.".format(from_page)
         LOG.info(lt)
@@ -175,8 +156,9 @@ def copy_one_page(s, from_site, to_site, from_page, convert=True, expt={}):
                     k, page_to[k], page_to_save[k]
                 ))
 
-        no_change = no_change and compare_dict_values(page_to, page_to_save,
-                                                      keys=['content', 'title', 'tags'])
+        with stage_timer('compare'):
+            no_change = no_change and compare_dict_values(page_to, page_to_save,
+                                                          keys=['content', 'title', 'tags'])
 
         if no_change:
             LOG.info("{}: No change detected compared to existing page.".format(from_page))
@@ -188,6 +170,12 @@ def copy_one_page(s, from_site, to_site, from_page, convert=True, expt={}):
         res["saved"] = True
         LOG.debug("Saved page:\n{}".format(r))
     except Fault as e:
+        # rate-limit / transient faults were already retried by the api client; only a
+        # permanent rejection (e.g. invalid tags) is worth another try without tags
+        if classify_error(e) != PERMANENT:
+            LOG.error('{}: failed save with exception: {}. Skipping'.format(from_page, e))
+            res["failed"] = True
+            return res
         LOG.error('{}: failed save with exception: {}. Trying with removed tags...'.format(from_page, e))
         page_to_save.pop('tags')
         try:
@@ -197,12 +185,158 @@ def copy_one_page(s, from_site, to_site, from_page, convert=True, expt={}):
         except:
             LOG.error('{}: failed save with exception: {}. Skipping'.format(from_page, e))
             LOG.debug("Page data:\n{}".format(page_to_save))
+            res["failed"] = True
+    return res
+
+
+def is_broken_page(from_page, res):
+    # if for some pages we know the content is broken/incomplete,
+    # skip automation and do it manually.
+    if from_page in CONTENT_BROKEN_PAGES:
+        lt = "{}: Known page with incomplete content. Not copying.".format(from_page)
+        LOG.info(lt)
+        res["log_text_lines"].append(lt)
+        return True
+    return False
+
+
+def convert_and_save_page(s, from_site, to_site, from_page, convert=True, expt={}, target_exists=None):
+    """
+    Convert one page and save it to to_site if it changed: copy_one_page without the Slack report,
+    for callers that report on their own (e.g. the http service).
+
+    Args:
+        s: authorized WikidotAPI instance
+        from_site: site to copy from
+        to_site: site to copy to
+        from_page: page name to copy from
+        convert: True if convert from simplified Chinese to Traditional Chinese
+        expt: conversion exceptions, dict or ExceptionMatcher from compile_exception_dict
+        target_exists: False if page metadata already shows the page is missing in to_site
+
+    Returns: dictionary of option report
+
+    """
+    res = {
+        "converted": False,
+        "saved": False,
+        "log_text_lines": []
+    }
+
+    if is_broken_page(from_page, res):
+        return res
+
+    page_from = s.get_single_page(from_site, from_page)
+    page_to_save, res["converted"] = build_page_to_save(page_from, to_site, convert=convert, expt=expt)
+    LOG.debug("Page to save:\n{}".format(page_to_save))
+
+    page_to = get_target_page(s, to_site, from_page, res, target_exists=target_exists)
+    save_page_if_changed(s, from_page, page_to_save, page_to, res)
+    if not res.get("failed"):
+        record_page_hashes(res, page_from, page_to_save)
     return res
-    # pass
 
 
-@notify_status(job_name='Convert Site')
-def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True, exception={}):
+@notify_status(job_name='Copy one page')
+def copy_one_page(s, from_site, to_site, from_page, convert=True, expt={}, target_exists=None):
+    # single page job (convert_site --page, test): convert_and_save_page with a Slack report
+    return convert_and_save_page(s, from_site, to_site, from_page, convert=convert, expt=expt,
+                                 target_exists=target_exists)
+
+
+def pipelined_copy(s, from_site, to_site, pages, convert=True, exception={}, to_site_pages=None,
+                   processes=0, stats=None, gate=None):
+    """
+    Same work as copy_one_page for every page, as a staged pipeline:
+    fetch (source and target in parallel) -> convert (process pool) -> compare and save.
+    Stages are connected by bounded queues, so a slow stage holds back the ones before it.
+
+    Args:
+        s: authorized WikidotAPI instance
+        from_site:
+        to_site:
+        pages: pages to copy
+        convert:
+        exception: ExceptionMatcher
+        to_site_pages: pages known to exist in to_site (set or PageIndex), None if unknown
+        processes: conversion worker processes; 0 converts on threads in this process
+        stats: dict filled with per-stage counters when the run ends
+        gate: ParentGate; a child page enters the pipeline only once its parent has left it
+
+    Yields: (page, copy_one_page-style response), in completion order
+    """
+    def new_ctx(p):
+        return {"page": p, "res": {"converted": False, "saved": False, "log_text_lines": []}, "done": False}
+
+    def guarded(stage_name, func):
+        def run(ctx):
+            if ctx["done"]:
+                return ctx
+            try:
+                func(ctx)
+            except Exception as e:
+                LOG.error("{}: Failed processing in {} due to exception: {}".format(ctx["page"], stage_name, e))
+                ctx["res"]["failed"] = True
+                ctx["done"] = True
+            return ctx
+        return run
+
+    with ExitStack() as stack:
+        target_fetcher = stack.enter_context(ThreadPoolExecutor(max_workers=s.max_workers))
+        # without processes conversion runs on the pipeline threads
+        converter = None
+        if processes:
+            converter = stack.enter_context(ProcessPoolExecutor(
+                max_workers=processes, initializer=init_convert_worker,
+                initargs=(exception.exception_dict, exception.ordered, get_cache().path if get_cache() else None)))
+
+        def fetch(ctx):
+            p = ctx["page"]
+            if is_broken_page(p, ctx["res"]):
+                ctx["done"] = True
+                return
+            target_exists = None if to_site_pages is None else p in to_site_pages
+            target = target_fetcher.submit(get_target_page, s, to_site, p, ctx["res"], target_exists)
+            ctx["page_from"] = s.get_single_page(from_site, p)
+            ctx["page_to"] = target.result()
+
+        def convert_page(ctx):
+            if converter:
+                _, ctx["page_to_save"], converted = converter.submit(
+                    convert_batch, ([(ctx["page"], ctx["page_from"])], to_site, convert)).result()[0]
+                if ctx["page_to_save"] is None:
+                    raise ValueError("conversion failed")
+            else:
+                ctx["page_to_save"], converted = build_page_to_save(ctx["page_from"], to_site,
+                                                                    convert=convert, expt=exception)
+            ctx["res"]["converted"] = converted
+
+        def save(ctx):
+            save_page_if_changed(s, ctx["page"], ctx["page_to_save"], ctx["page_to"], ctx["res"])
+            if not ctx["res"].get("failed"):
+                record_page_hashes(ctx["res"], ctx["page_from"], ctx["page_to_save"])
+
+        pipeline = Pipeline([
+            Stage('fetch', guarded('fetch', fetch), workers=s.max_workers),
+            Stage('convert', guarded('convert', convert_page), workers=processes or 1),
+            Stage('save', guarded('save', save), workers=s.max_workers),
+        ])
+        if gate:
+            pages = gate.iter(pages)
+        for ctx in pipeline.run(new_ctx(p) for p in pages):
+            if gate:
+                gate.done(ctx["page"])
+            yield ctx["page"], ctx["res"]
+
+        if stats is not None:
+            stats.update(pipeline.stats())
+        LOG.info("Pipeline stats: {}".format(pipeline.stats()))
+
+
+@notify_status(job_name='Convert Site', with_metrics=True)
+def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True, exception={},
+               incremental=False, state_path=PATH_SYNC_STATE, journal=None, pipeline=False, processes=0,
+               prioritize=None, category_weights=None, budget=None, report_pages=True):
     """
 
     Args:
@@ -213,6 +347,18 @@ def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True,
         page:
         convert:
         exception:
+        incremental: only process pages changed in source or drifted in target since the last sync
+        state_path: sqlite file keeping the sync state for incremental runs
+        journal: CheckpointJournal; pages already completed in it are skipped and the report covers them
+        pipeline: overlap fetch, conversion and save in a staged pipeline (see pipelined_copy)
+        processes: conversion worker processes for the pipeline
+        prioritize: process pages by priority (missing in target, recently edited, category weight),
+                    parents before children (see api/priority.py); otherwise in pages.select order.
+                    None: only when the metadata is fetched anyway (incremental), True: also fetch it
+        category_weights: category -> priority weight, CATEGORY_WEIGHTS if None
+        budget: RunBudget; no new pages are started once it is used up, pages in flight finish
+                and the report covers the pages done
+        report_pages: send a Slack report per page (copy_one_page); False for convert_and_save_page
 
     Returns:
 
@@ -220,10 +366,15 @@ def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True,
     r = {
         "pages_updated": [],
         "pages_converted": [],
+        "pages_skipped": [],
+        "pages_failed": [],
     }
 
     process_count = 0
 
+    # build the exception matcher once for the whole run
+    exception = compile_exception_dict(exception)
+
     pages = s.get_pages(from_site, categories=categories)
 
     # convert one single page
@@ -232,41 +383,171 @@ def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True,
 
     LOG.info("Retrieved {} pages in categories: {}".format(len(pages), categories))
 
-    LOG.info("Pages to process: {}".format(pages))
     start_time = time.time()
-    for p in pages:
+
+    pages_to_process = pages
+    state = None
+    # PageIndex of both sites (records read like page metadata), when the run needs them;
+    # names are interned in a table of this run only, freed with it
+    page_names = PageNames()
+    to_site_pages = None
+    meta_from = None
+    if incremental:
+        state = SyncState(from_site, to_site, path=state_path)
+        stored = state.all()
+        meta_from = s.get_pages_index(from_site, with_meta=True, pages=pages, page_names=page_names)
+        pages = list(meta_from)
+        to_site_pages = s.get_pages_index(to_site, categories=categories, page_names=page_names)
+        to_site_pages.update_meta(s.get_pages_meta(to_site, [p for p in pages if p in to_site_pages]))
+        meta_to = to_site_pages
+
+        pages_to_process = []
+        for p in pages:
+            reason = state.needs_sync(p, meta_from.get(p, {}), meta_to.get(p), state=stored.get(p),
+                                      digest=exception.digest)
+            if reason:
+                LOG.debug("{}: needs sync ({}).".format(p, reason))
+                pages_to_process.append(p)
+            else:
+                r["pages_skipped"].append(p)
+        LOG.info("Incremental: {}/{} pages changed since last sync.".format(len(pages_to_process), len(pages)))
+
+    if journal:
+        resumed = [p for p in pages_to_process if journal.is_done(p)]
+        pages_to_process = [p for p in pages_to_process if not journal.is_done(p)]
+        if resumed:
+            LOG.info("Resume: {} pages already completed in journal.".format(len(resumed)))
+
+    # parent page in this run, for pages whose parent is processed too
+    parents = {}
+    if prioritize is None:
+        # ordering costs pages.get_meta calls and a target listing unless incremental fetched them already
+        prioritize = meta_from is not None and to_site_pages is not None
+    if prioritize and len(pages_to_process) > 1:
+        if meta_from is None:
+            meta_from = s.get_pages_index(from_site, with_meta=True, pages=pages_to_process,
+                                          page_names=page_names)
+        if to_site_pages is None:
+            to_site_pages = s.get_pages_index(to_site, categories=categories, page_names=page_names)
+        pages_to_process, scores = prioritize_pages(pages_to_process, meta_from, to_site_pages,
+                                                    category_weights=category_weights or CATEGORY_WEIGHTS)
+        LOG.info("Priority order, first pages: {}".format(
+            ', '.join('{} ({:.1f})'.format(p, scores[p]) for p in pages_to_process[:10])))
+        to_process = set(pages_to_process)
+        parents = {p: (meta_from.get(p) or {}).get('parent_fullname') for p in pages_to_process}
+        parents = {p: par for p, par in parents.items() if par in to_process and par != p}
+
+    LOG.info("Pages to process: {}".format(pages_to_process))
+
+    # a child is only handed out once its parent is saved; workers never wait for it
+    gate = ParentGate(parents)
+
+    def process_page(p):
         LOG.debug("{}: start processing...".format(p))
-        process_count += 1
         response = {
             "converted": False,
             "saved": False
         }
         try:
-            response = copy_one_page(s, from_site, to_site, p, convert=convert, expt=exception)
+            target_exists = None if to_site_pages is None else p in to_site_pages
+            copy_page = copy_one_page if report_pages else convert_and_save_page
+            response = copy_page(s, from_site, to_site, p, convert=convert, expt=exception,
+                                 target_exists=target_exists)
         except Exception as e:
             LOG.error("{}: Failed processing due to exception: {}".format(p, e))
+            response["failed"] = True
+        finally:
+            gate.done(p)
+        return p, response
+
+    synced = {}
+    pages_iter = budget.take(pages_to_process) if budget else pages_to_process
+
+    if pipeline:
+        r["pipeline_stats"] = {}
+        responses = pipelined_copy(s, from_site, to_site, pages_iter, convert=convert, exception=exception,
+                                   to_site_pages=to_site_pages, processes=processes, stats=r["pipeline_stats"],
+                                   gate=gate)
+    else:
+        # pages run concurrently on the api worker pool, within the shared rate limit
+        responses = s.map(process_page, gate.iter(pages_iter))
+
+    for p, response in responses:
+        process_count += 1
+        if budget:
+            budget.done()
 
-        if response["converted"]:
+        if response.get("converted"):
             r["pages_converted"].append(p)
-        if response["saved"]:
+        if response.get("saved"):
             r["pages_updated"].append(p)
+        if response.get("failed") or "err" in response:
+            # not synced: incremental and resumed runs pick it up again
+            r["pages_failed"].append(p)
+        elif "target_hash" in response:
+            synced[p] = response
+            if meta_from is not None and p in meta_from:
+                meta_from.get(p).content_hash = response["content_hash"]
+            if journal:
+                outcome = {k: response[k] for k in ("converted", "saved", "content_hash", "target_hash")}
+                outcome["exception_digest"] = exception.digest
+                journal.record(p, outcome)
 
         if process_count % 100 == 0:
             LOG.info("PROCESSED {} pages in {} sec.".format(
                 process_count, time.time() - start_time
             ))
 
-    r["pages_unconverted"] = list(set(pages) - set(r["pages_converted"]))
+    budget_text = ''
+    if budget and budget.stopped:
+        # the rest is left for the next run (--resume / --incremental pick it up)
+        r["pages_deferred"] = pages_to_process[budget.started:]
+        pages_to_process = pages_to_process[:budget.started]
+        r["budget"] = budget.summary()
+        budget_text = "Stopped early ({}): {} pages left for the next run.".format(
+            budget.stopped, len(r["pages_deferred"]))
+
+    if state:
+        if journal:
+            # include pages completed by an interrupted earlier run
+            synced = {p: journal.outcome(p) for p in pages if (journal.outcome(p) or {}).get("target_hash")}
+        # record target revisions after our own saves so they do not count as drift next time
+        meta_to = dict(s.get_pages_meta(to_site, list(synced)))
+        for p, response in synced.items():
+            if p in meta_to:
+                state.record(p, meta_from.get(p, {}), meta_to[p], response["content_hash"], response["target_hash"],
+                             response.get("exception_digest", exception.digest))
+        state.close()
+
+    if journal:
+        if not (budget and budget.stopped):
+            # every page was attempted: a later --resume starts a new run (failed pages are tried again)
+            journal.mark_complete()
+        # rebuild the report from the journal so it covers pages done by earlier, interrupted runs
+        journal.close()
+        to_process = set(pages_to_process)
+        processed = [p for p in pages if p in to_process or journal.is_done(p)]
+        r["pages_converted"] = [p for p in processed if (journal.outcome(p) or {}).get("converted")]
+        r["pages_updated"] = [p for p in processed if (journal.outcome(p) or {}).get("saved")]
+        r["pages_unconverted"] = list(set(processed) - set(r["pages_converted"]))
+    else:
+        r["pages_unconverted"] = list(set(pages_to_process) - set(r["pages_converted"]))
 
     r["log_text"] = """
         Finished processing. [category: {} page: {}]
         {}/{} pages are updated: {}
         {}/{} pages are not converted: {}
+        {}/{} pages are unchanged since last sync.
+        {}/{} pages failed: {}
+        {}
         Entire process took {} sec.
     """.format(
         ','.join(categories) if categories else None, page,
         len(r["pages_updated"]), len(pages), r["pages_updated"],
         len(r["pages_unconverted"]), len(pages), r["pages_unconverted"],
+        len(r["pages_skipped"]), len(pages),
+        len(r["pages_failed"]), len(pages), r["pages_failed"],
+        budget_text,
         time.time() - start_time
     )
 
@@ -275,18 +556,57 @@ def copy_pages(s, from_site, to_site, categories=None, page=None, convert=True,
     return r
 
 
+def parse_weights(weights):
+    # ["song=2", "news=0.5"] -> CATEGORY_WEIGHTS updated with {"song": 2.0, "news": 0.5}
+    r = dict(CATEGORY_WEIGHTS)
+    for w in weights:
+        category, _, value = w.partition('=')
+        r[category] = float(value)
+    return r
+
+
+def open_journal(args, action):
+    # checkpoint journal only when asked for: a plain run must not truncate the journal of an
+    # interrupted run that is meant to be resumed
+    if not (args.resume or args.journal):
+        return None
+    return CheckpointJournal(args.journal or PATH_JOURNAL_TEMPLATE.format(action=action), resume=args.resume)
+
+
+@notify_status(job_name='Site Jobs')
+def merge_reports(report_files):
+    """
+    Combine per-shard reports (written with --report) into one result and one Slack summary.
+
+    Args:
+        report_files: list of report json paths
+
+    Returns: merged result dict
+    """
+    results = []
+    for path in report_files:
+        with io.open(path, 'r', encoding='utf-8') as fh:
+            results.append(json.load(fh))
+    r = merge_result_dicts(results)
+    r.setdefault('log_text_lines', []).insert(0, "Merged {} shard reports.".format(len(results)))
+    return r
+
+
 def main():
     """
     A series of command line actions to perform wikidot site operations.
     Suppoprt site archive, site copy, site translation from simplified Chinese to Traditional Chinese.
 
     Supported actions:
-    - archive_site: archive site to a json file locally
-    - save_files: save archived files from one site to a json file locally 
+    - archive_site: archive site to a block-compressed jsonl file (+ .idx page index) locally
+    - save_files: save all files of a site's pages to a local content-addressed store (--output dir)
     - convert_site: convert pages from one site to another (zh-cn to zh-tw)
     - compare_sites: compare two sites and update different pages/files
     - get_page: get one single page content
     - copy_files: copy files from one site to another
+    - convert_archive: convert an archive offline into the pages convert_site would save
+    - diff_archives: compare two archives offline (removed/added/changed pages and files)
+    - merge_reports: combine per-shard reports into one Slack summary
     - test: test overall functionality
     - test_convert: test convert one single page content
     Returns: exit code 0 if success; 1 otherwise
@@ -307,6 +627,56 @@ def main():
     parser.add_argument('--site', action='store', help='site to perform action on', default=FROM_SITE)
     parser.add_argument('--category', action='store', help='convert categories', nargs='*')
     parser.add_argument('--page', action='store', help='test convert page')
+    parser.add_argument('--workers', action='store', type=int, default=API_MAX_WORKERS,
+                        help='concurrent api requests (within the rate limit)')
+    parser.add_argument('--incremental', action='store_true', default=False,
+                        help='only convert pages changed since the last sync')
+    parser.add_argument('--state', action='store', default=PATH_SYNC_STATE, help='sync state file for --incremental')
+    parser.add_argument('--resume', action='store_true', default=False,
+                        help='skip pages/files completed in the checkpoint journal of an interrupted run')
+    parser.add_argument('--journal', action='store', default=None,
+                        help='checkpoint journal file; runs keep one only with --resume or --journal')
+    parser.add_argument('--processes', action='store', type=int, default=None,
+                        help='conversion worker processes for convert_archive (default: cpu count) '
+                             'and convert_site --pipeline (default: convert on threads)')
+    parser.add_argument('--max_runtime', '--max-runtime', action='store', type=float, default=None,
+                        help='convert_site / compare_sites: seconds; stop starting new work when it would run over')
+    parser.add_argument('--max_requests', '--max-requests', action='store', type=int, default=None,
+                        help='convert_site / compare_sites: api requests allowed for the run')
+    parser.add_argument('--priority', action='store_true', default=False,
+                        help='convert_site: process pages by priority, fetching page metadata if needed '
+                             '(default: only with --incremental, which fetches it anyway)')
+    parser.add_argument('--no_priority', action='store_true', default=False,
+                        help='convert_site: process pages in pages.select order instead of by priority')
+    parser.add_argument('--weights', action='store', nargs='*', default=[], metavar='CATEGORY=WEIGHT',
+                        help='convert_site: category priority weights, on top of CATEGORY_WEIGHTS')
+    parser.add_argument('--pipeline', action='store_true', default=False,
+                        help='convert_site: overlap fetch, conversion and save stages')
+    parser.add_argument('--inventory', action='store', default=PATH_FILE_INVENTORY,
+                        help='compare_sites: file inventory of both sites (only pages changed since are listed again)')
+    parser.add_argument('--upload_site', action='store', default=None,
+                        help='save_files: also upload the saved files to this site (skipping files it already has)')
+    parser.add_argument('--with_files', action='store_true', default=False,
+                        help='archive_site: record file names of each page')
+    parser.add_argument('--archives', action='store', nargs=2, default=None, metavar=('FROM', 'TO'),
+                        help='archives to compare for diff_archives')
+    parser.add_argument('--fields', action='store', nargs='*', default=None,
+                        help='diff_archives: page fields to compare (content title tags parent_fullname files)')
+    parser.add_argument('--shard', action='store', default=None,
+                        help='i/N: only process pages of shard i (0-based) out of N')
+    parser.add_argument('--report', action='store', default=None, help='write the job result to a json file')
+    parser.add_argument('--reports', action='store', nargs='*', default=[], help='report files for merge_reports')
+    parser.add_argument('--metrics', action='store', default=None,
+                        help='write api call metrics (latency, bytes, retries, rate-limit wait) to a json file')
+    parser.add_argument('--profile', action='store', nargs='?', const='deterministic', default=None,
+                        choices=PROFILE_MODES,
+                        help='profile the action: deterministic (cProfile, .pstats) or sampling (collapsed stacks)')
+    parser.add_argument('--profile_out', action='store', default=None,
+                        help='profile output path without extension (default: <action>.profile)')
+    parser.add_argument('--cache', action='store', default=PATH_CONVERT_CACHE, help='conversion cache file')
+    parser.add_argument('--no_cache', action='store_true', default=False, help='disable the conversion cache')
+    parser.add_argument('--ordered_exceptions', action='store_true', default=False,
+                        help='apply conversion exceptions one key at a time in dict order (legacy behaviour)')
 
     args = parser.parse_args()
 
@@ -325,49 +695,86 @@ def main():
         LOG.setLevel(logging.DEBUG)
 
     action = args.action
+    shard = parse_shard(args.shard)
+    result = None
+
+    if shard:
+        LOG.info("Running shard {}/{}.".format(*shard))
+        SlackWebHook.MUTED = True
+
+    if not args.no_cache and action in ('convert_site', 'test', 'test_convert'):
+        enable_cache(path=args.cache)
+
+    budget = RunBudget(max_runtime=args.max_runtime, max_requests=args.max_requests)
+    budget = budget if budget else None
+
+    profiler = None
+    if args.profile:
+        profiler = Profiler(args.profile_out or '{}.profile'.format(action), mode=args.profile)
+        profiler.start()
 
     if action == 'archive_site':
         to_zip = args.zip
         site_to_archive = args.site
 
         if args.output:
-            json_out = args.ouput
+            archive_out = args.output
         else:
             today = datetime.strftime(datetime.today(), "%Y-%m-%d")
-            json_out = '{}_{}.json'.format(site_to_archive, today)
-
-        json_out_file = io.open(json_out, 'w', encoding='utf-8')
+            archive_out = '{}_{}.jsonl.gz'.format(site_to_archive, today)
 
-        wa = WikidotAPI()
-        wa.archive_site(site_to_archive, json_out_file)
+        wa = WikidotAPI(max_workers=args.workers, shard=shard)
+        wa.archive_site(site_to_archive, archive_out, resume=args.resume, with_files=args.with_files)
 
         if to_zip:
-            zip_file(json_out, json_out+'.zip')
+            zip_file(archive_out, archive_out+'.zip')
 
     elif action == 'save_files':
-        wa = WikidotAPI()
-        save_archive_files(wa, args.site, ['cover'], '/tmp', upload_site='horizon-test')
+        wa = WikidotAPI(permission='rw' if args.upload_site else 'ro', max_workers=args.workers, shard=shard)
+        result = save_archive_files(wa, args.site, args.category or ['cover'], args.output or '/tmp',
+                                    upload_site=args.upload_site)
 
     elif action == 'convert_site':
         cat = args.category
         page = args.page
         
-        expt = json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8'))
+        expt = compile_exception_dict(json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8')),
+                                      ordered=args.ordered_exceptions)
+        preload_converter()
 
-        wa = WikidotAPI(permission='rw')
+        wa = WikidotAPI(permission='rw', max_workers=args.workers, shard=shard)
+        journal = open_journal(args, action)
 
-        copy_pages(wa, FROM_SITE, TO_SITE,
+        result = copy_pages(wa, FROM_SITE, TO_SITE,
                    categories=cat, page=page,
-                   convert=True, exception=expt)
+                   convert=True, exception=expt,
+                   incremental=args.incremental, state_path=args.state,
+                   journal=journal, pipeline=args.pipeline, processes=args.processes or 0,
+                   prioritize=False if args.no_priority else (True if args.priority else None),
+                   category_weights=parse_weights(args.weights),
+                   budget=budget)
 
 
     elif action == 'compare_sites':
-        wa = WikidotAPI()
-        wa.compare_sites(
+        wa = WikidotAPI(max_workers=args.workers, shard=shard)
+        result = wa.compare_sites(
             update_files=args.update_files,
-            update_pages=args.update_pages)
+            update_pages=args.update_pages,
+            inventory_path=args.inventory,
+            budget=budget)
         # pass
 
+    elif action == 'convert_archive':
+        expt = json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8'))
+        result = convert_archive(args.input, args.output, exception=expt, ordered=args.ordered_exceptions,
+                                 workers=args.processes, cache_path=None if args.no_cache else args.cache)
+
+    elif action == 'diff_archives':
+        result = diff_archives(args.archives[0], args.archives[1], fields=args.fields)
+
+    elif action == 'merge_reports':
+        result = merge_reports(args.reports)
+
     elif action == 'get_page':
 
         wa = WikidotAPI()
@@ -379,8 +786,9 @@ def main():
     elif action == 'copy_files':
         cat = args.category
         page = args.page
-        wa = WikidotAPI(permission='rw')
-        wa.copy_files(FROM_SITE, TO_SITE, categories=cat, page=page)
+        wa = WikidotAPI(permission='rw', max_workers=args.workers, shard=shard)
+        journal = open_journal(args, action)
+        wa.copy_files(categories=cat, page=page, journal=journal)
 
     elif action == 'test':
 
@@ -391,7 +799,8 @@ def main():
         print(wa.get_categories(FROM_SITE))
         print(os.environ)
         # wa.copy_files(from_site, to_site, categories=cat, page=page)
-        expt = json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8'))
+        expt = compile_exception_dict(json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8')),
+                                      ordered=args.ordered_exceptions)
         copy_pages(wa, FROM_SITE, TO_SITE,
                    categories=cat, page=page,
                    convert=True, exception=expt)
@@ -402,7 +811,8 @@ def main():
         # print len(all_pages_sc), all_pages_sc
         # all_pages_tc = s2.pages.select({'site': tc})
         # print len(all_pages_tc), all_pages_tc
-        expt = json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8'))
+        expt = compile_exception_dict(json.load(io.open(PATH_CONVERT_EXCEPTION, 'r', encoding='utf-8')),
+                                      ordered=args.ordered_exceptions)
         # print(expt)
         # tctest="video:tc-test"
         tctest="play:ousama-kun-to-ryoufuku-kun-no-bouken"
@@ -425,6 +835,19 @@ def main():
     else:
         LOG.error("Unrecognized action: {}".format(action))
         return 1
+
+    if profiler:
+        LOG.info("Wrote profile to {}".format(profiler.stop()))
+        LOG.info("Stage timings:\n{}".format(METRICS.report_text()))
+
+    if args.metrics:
+        METRICS.write_json(args.metrics)
+        LOG.info("Wrote api metrics to {}".format(args.metrics))
+
+    if args.report and result is not None:
+        with io.open(args.report, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, ensure_ascii=False)
+        LOG.info("Wrote report to {}".format(args.report))
         
 
 if __name__ == "__main__":